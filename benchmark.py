@@ -0,0 +1,309 @@
+"""
+Benchmark local do consumidor: roda o pipeline do script.py contra um SQS
+em memória e um site sintético servido localmente, sem AWS e sem o site da SEFAZ.
+
+Uso:
+    python benchmark.py --messages 50 --latency-ms 200 --page-kb 100 --concurrency 4
+    python benchmark.py --executor http --messages 500
+
+Reporta mensagens/s, p50/p95/p99 da latência dos jobs e ponta a ponta,
+quantidade de navegadores iniciados e pico de RSS (processo + Chrome).
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import psutil
+
+class FakeSQS:
+    """
+    Stand-in em memória do cliente SQS do boto3 com as chamadas usadas pelo
+    consumidor: long polling, visibility timeout, contagem de entregas e APIs em lote.
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._visible = []
+        self._in_flight = {}
+        self._ids = itertools.count()
+        self.sent_at = {}
+        self.acked_at = {}
+        self.dead_letters = []
+        self.calls = {}
+
+    def _count(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def enqueue(self, body):
+        with self._cond:
+            message_id = str(uuid.uuid4())
+            self._visible.append({"MessageId": message_id, "Body": body, "receives": 0, "first": None})
+            self.sent_at[message_id] = time.monotonic()
+            self._cond.notify_all()
+
+    def _requeue_expired(self, now):
+        for handle, (message, visible_at) in list(self._in_flight.items()):
+            if visible_at <= now:
+                del self._in_flight[handle]
+                self._visible.append(message)
+
+    def receive_message(self, QueueUrl, MaxNumberOfMessages=1, WaitTimeSeconds=0, VisibilityTimeout=30, **kwargs):
+        deadline = time.monotonic() + WaitTimeSeconds
+        with self._cond:
+            self._count("receive_message")
+            while True:
+                now = time.monotonic()
+                self._requeue_expired(now)
+                if self._visible or now >= deadline:
+                    break
+                self._cond.wait(min(0.1, deadline - now))
+
+            messages = []
+            while self._visible and len(messages) < MaxNumberOfMessages:
+                message = self._visible.pop(0)
+                message["receives"] += 1
+                message["first"] = message["first"] or int(time.time() * 1000)
+                handle = f"{message['MessageId']}#{next(self._ids)}"
+                self._in_flight[handle] = (message, now + VisibilityTimeout)
+                messages.append({
+                    "MessageId": message["MessageId"],
+                    "ReceiptHandle": handle,
+                    "Body": message["Body"],
+                    "Attributes": {
+                        "ApproximateReceiveCount": str(message["receives"]),
+                        "ApproximateFirstReceiveTimestamp": str(message["first"]),
+                    },
+                })
+            return {"Messages": messages}
+
+    def delete_message_batch(self, QueueUrl, Entries):
+        with self._cond:
+            self._count("delete_message_batch")
+            successful, failed = [], []
+            for entry in Entries:
+                item = self._in_flight.pop(entry["ReceiptHandle"], None)
+                if item is None:
+                    failed.append({"Id": entry["Id"], "Code": "ReceiptHandleIsInvalid", "SenderFault": True})
+                    continue
+                self.acked_at[item[0]["MessageId"]] = time.monotonic()
+                successful.append({"Id": entry["Id"]})
+            self._cond.notify_all()
+            return {"Successful": successful, "Failed": failed}
+
+    def change_message_visibility(self, QueueUrl, ReceiptHandle, VisibilityTimeout):
+        self.change_message_visibility_batch(
+            QueueUrl, [{"Id": "0", "ReceiptHandle": ReceiptHandle, "VisibilityTimeout": VisibilityTimeout}]
+        )
+
+    def change_message_visibility_batch(self, QueueUrl, Entries):
+        with self._cond:
+            self._count("change_message_visibility_batch")
+            now = time.monotonic()
+            successful, failed = [], []
+            for entry in Entries:
+                item = self._in_flight.get(entry["ReceiptHandle"])
+                if item is None:
+                    failed.append({"Id": entry["Id"], "Code": "ReceiptHandleIsInvalid", "SenderFault": True})
+                    continue
+                self._in_flight[entry["ReceiptHandle"]] = (item[0], now + entry["VisibilityTimeout"])
+                successful.append({"Id": entry["Id"]})
+            self._cond.notify_all()
+            return {"Successful": successful, "Failed": failed}
+
+    def send_message_batch(self, QueueUrl, Entries):
+        with self._cond:
+            self._count("send_message_batch")
+            self.dead_letters.extend(Entries)
+            return {"Successful": [{"Id": entry["Id"]} for entry in Entries], "Failed": []}
+
+    def done(self, total):
+        with self._cond:
+            return len(self.acked_at) >= total
+
+def start_site(latency_ms, page_kb):
+    """Sobe um servidor HTTP local com uma página sintética de tamanho e latência configuráveis."""
+    padding = "x" * (page_kb * 1024)
+    page = (
+        "<html><head><title>Consulta Benchmark</title></head><body>"
+        '<form method="post"><input type="hidden" name="__VIEWSTATE" value="bench" />'
+        f'<div id="conteudo">ok</div><p>{padding}</p></form></body></html>'
+    ).encode("utf-8")
+
+    class Handler(BaseHTTPRequestHandler):
+        def _respond(self):
+            time.sleep(latency_ms / 1000)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(page)))
+            self.end_headers()
+            self.wfile.write(page)
+
+        do_GET = _respond
+        do_POST = _respond
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, name="bench-site", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/ConsultaPublicaCfe.aspx"
+
+class PeakRssSampler:
+    """Amostra o RSS do processo e de todos os filhos (chromedriver + Chrome)."""
+    def __init__(self, interval=0.2):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="bench-rss", daemon=True)
+
+    def _run(self):
+        root = psutil.Process()
+        while not self._stop.wait(self.interval):
+            total = 0
+            for process in [root] + root.children(recursive=True):
+                try:
+                    total += process.memory_info().rss
+                except psutil.NoSuchProcess:
+                    pass
+            self.peak = max(self.peak, total)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+def summarize(values):
+    return {f"p{pct}": percentile(values, pct) for pct in (50, 95, 99)}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=2, help="WORKER_CONCURRENCY do consumidor")
+    parser.add_argument("--latency-ms", type=int, default=100, help="latência do site sintético")
+    parser.add_argument("--page-kb", type=int, default=50, help="tamanho da página sintética")
+    parser.add_argument("--executor", choices=("browser", "http"), default="browser")
+    parser.add_argument("--duplicates", type=float, default=0.0, help="fração de mensagens repetidas")
+    parser.add_argument("--timeout", type=float, default=600, help="limite de tempo do benchmark (s)")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    server, url = start_site(args.latency_ms, args.page_kb)
+
+    # Configuração lida pelo script.py na importação
+    os.environ.update({
+        "SQS_QUEUE_URL": "benchmark-queue",
+        "DLQ_URL": "benchmark-dlq",
+        "WORKER_CONCURRENCY": str(args.concurrency),
+        "WEBSITE_URL": url,
+        "RECEIVE_WAIT_TIME_SECONDS": os.getenv("RECEIVE_WAIT_TIME_SECONDS", "1"),
+        "JOB_DEFINITIONS": json.dumps({"benchmark": {"executor": args.executor}}),
+        "DD_TRACE_ENABLED": os.getenv("DD_TRACE_ENABLED", "false"),
+    })
+    import script
+
+    fake_sqs = FakeSQS()
+    script.sqs_client = fake_sqs
+
+    launches = []
+    setup_driver = script.setup_driver
+
+    def counting_setup_driver(*a, **kw):
+        launches.append(time.monotonic())
+        return setup_driver(*a, **kw)
+
+    script.setup_driver = counting_setup_driver
+
+    job_latencies = []
+    process_message = script.process_message
+
+    def timed_process_message(message):
+        start_time = time.monotonic()
+        try:
+            return process_message(message)
+        finally:
+            job_latencies.append(time.monotonic() - start_time)
+
+    script.process_message = timed_process_message
+
+    hits = {"result_cache": 0, "dedup": 0}
+
+    def counting_get(store, name):
+        get = store.get
+
+        def wrapper(key):
+            value = get(key)
+            if value:
+                hits[name] += 1
+            return value
+        return wrapper
+
+    script.result_cache.get = counting_get(script.result_cache, "result_cache")
+    script.dedup_store.get = counting_get(script.dedup_store, "dedup")
+
+    # Jobs únicos diferem na URL (entra na chave do cache); só as repetições de
+    # --duplicates podem ser respondidas pelo cache ou pela deduplicação
+    unique = max(1, int(round(args.messages * (1 - args.duplicates))))
+    for i in range(args.messages):
+        fake_sqs.enqueue(json.dumps({"job_type": "benchmark", "url": f"{url}?n={i % unique}"}))
+
+    async def run_until_drained():
+        task = asyncio.create_task(script.consumer.run())
+        deadline = time.monotonic() + args.timeout
+        while not fake_sqs.done(args.messages) and time.monotonic() < deadline and not task.done():
+            await asyncio.sleep(0.05)
+        script.consumer.request_stop()
+        await task
+
+    sampler = PeakRssSampler()
+    sampler.start()
+    start_time = time.monotonic()
+    try:
+        if args.executor == "browser":
+            script.driver_pool.warm()
+        warm_seconds = time.monotonic() - start_time
+        start_time = time.monotonic()
+        asyncio.run(run_until_drained())
+        elapsed = time.monotonic() - start_time
+    finally:
+        script.driver_pool.shutdown()
+        sampler.stop()
+        server.shutdown()
+
+    end_to_end = [fake_sqs.acked_at[mid] - fake_sqs.sent_at[mid] for mid in fake_sqs.acked_at]
+    report = {
+        "messages": args.messages,
+        "acked": len(fake_sqs.acked_at),
+        "dead_lettered": len(fake_sqs.dead_letters),
+        "elapsed_seconds": elapsed,
+        "warm_seconds": warm_seconds,
+        "messages_per_second": len(fake_sqs.acked_at) / elapsed if elapsed else None,
+        "job_latency_seconds": summarize(job_latencies),
+        "end_to_end_latency_seconds": summarize(end_to_end),
+        "browser_launches": len(launches),
+        "result_cache_hits": hits["result_cache"],
+        "dedup_hits": hits["dedup"],
+        "peak_rss_mb": sampler.peak / 1024 / 1024,
+        "sqs_calls": fake_sqs.calls,
+    }
+    script.log_writer.stop()
+    print(json.dumps(report, indent=2))
+    return 0 if report["acked"] == args.messages else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
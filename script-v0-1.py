@@ -114,7 +114,7 @@ def process_message(message, thread_id):
 
     # Parse do payload
     try:
-        payload = eval(body)  # Converte o Body para dicionário
+        payload = json.loads(body)  # Converte o Body para dicionário (nunca usar eval)
         site_url = payload.get('WEBSITE_URL', WEBSITE_URL)
     except Exception as e:
         log.error(json.dumps({"action": "parse_payload", "thread_id": thread_id, "status": "error", "error": str(e)}))
@@ -1,19 +1,51 @@
 import os
 import time
+import asyncio
+import atexit
+import decimal
+import functools
+import hashlib
+import math
+import multiprocessing
+import numbers
+import shutil
+import signal
+import sqlite3
+import sys
+import tempfile
+import urllib3
 import uuid
 import boto3
+import psutil
 import logging
+import logging.handlers
+import queue
 import json
+import random
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from urllib.parse import urlencode, urlparse
 from ddtrace import tracer, patch
 from ddtrace.profiling import Profiler
 
+try:
+    import orjson  # Opcional: decodificação JSON mais rápida
+except ImportError:
+    orjson = None
+
 # Aplicar patch apenas para logs
 patch(logging=True)
 
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
+from selenium.common.exceptions import InvalidSessionIdException, TimeoutException, WebDriverException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
 
 # Configurar tracer
 tracer.configure(
@@ -25,28 +57,151 @@ tracer.configure(
 profiler = Profiler()
 profiler.start()
 
+# Configurações do pipeline de logs (formatação e escrita fora da thread que loga)
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+LOG_BATCH_SIZE = int(os.getenv('LOG_BATCH_SIZE', 256))
+
+def _dumps(log_record):
+    if orjson is not None:
+        return orjson.dumps(log_record, default=str).decode("utf-8")
+    return json.dumps(log_record, default=str)
+
+# Atributos que todo LogRecord já tem (mais os injetados pelo ddtrace e pelo handler);
+# o que sobrar no registro veio de extra={...} e vai para o JSON
+_STANDARD_RECORD_ATTRS = frozenset(logging.LogRecord("", logging.INFO, "", 0, "", (), None).__dict__) | {
+    "message", "asctime", "dd_trace_id", "dd_span_id",
+    "dd.trace_id", "dd.span_id", "dd.service", "dd.env", "dd.version",
+}
+
+def _typed_field(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (list, tuple, dict)):
+        return value
+    if isinstance(value, (numbers.Real, decimal.Decimal)):
+        return float(value)  # Decimal, numpy e afins continuam numéricos
+    return str(value)
+
 # Configurar logger estruturado em JSON para correlação com Datadog APM
 class JSONFormatter(logging.Formatter):
-    """Formato de log estruturado em JSON para correlação com Datadog APM."""
+    """
+    Formato de log estruturado em JSON para correlação com Datadog APM.
+    Campos passados em extra={...} são emitidos no nível raiz; números continuam
+    numéricos (para métricas em logs) e outros tipos viram texto.
+    """
     def format(self, record):
-        span = tracer.current_span()  # Obter o span atual, se existir
+        # IDs capturados na thread de origem pelo TraceContextQueueHandler
+        if hasattr(record, "dd_trace_id"):
+            trace_id, span_id = record.dd_trace_id, record.dd_span_id
+        else:
+            span = tracer.current_span()  # Obter o span atual, se existir
+            trace_id = span.trace_id if span else None  # Evitar erro caso não haja span
+            span_id = span.span_id if span else None
         log_record = {
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": datetime.utcfromtimestamp(record.created).isoformat(),
             "level": record.levelname,
             "logger": record.name,
             "message": record.getMessage(),
-            "dd.trace_id": span.trace_id if span else None,  # Evitar erro caso não haja span
-            "dd.span_id": span.span_id if span else None,  # Evitar erro caso não haja span
+            "dd.trace_id": trace_id,
+            "dd.span_id": span_id,
         }
-        return json.dumps(log_record)
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_RECORD_ATTRS and key not in log_record:
+                log_record[key] = _typed_field(value)
+        return _dumps(log_record)
+
+class TraceContextQueueHandler(logging.handlers.QueueHandler):
+    """
+    Enfileira o registro sem formatá-lo: na thread que loga só se capturam o span
+    atual e a mensagem final. Com a fila cheia o registro é descartado e contado,
+    para que o log nunca bloqueie um worker.
+    """
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        span = tracer.current_span()
+        record.dd_trace_id = span.trace_id if span else None
+        record.dd_span_id = span.span_id if span else None
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class LogWriter:
+    """Thread que formata os registros enfileirados e os escreve em lote no stream."""
+    def __init__(self, handler, formatter, stream, batch_size):
+        self.handler = handler
+        self.formatter = formatter
+        self.stream = stream
+        self.batch_size = max(1, batch_size)
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Escreve o que estiver na fila e encerra a thread."""
+        if self._thread and self._thread.is_alive():
+            self.handler.queue.put(None)
+            self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        log_queue = self.handler.queue
+        while True:
+            records = [log_queue.get()]
+            while len(records) < self.batch_size:
+                try:
+                    records.append(log_queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in records
+            lines = [self._format(record) for record in records if record is not None]
+            if self.handler.dropped:
+                dropped, self.handler.dropped = self.handler.dropped, 0
+                lines.append(_dumps({
+                    "timestamp": datetime.utcnow().isoformat(),
+                    "level": "WARNING",
+                    "logger": log.name,
+                    "message": f"{dropped} registros de log descartados (fila cheia).",
+                }))
+            if lines:
+                self.stream.write("\n".join(lines) + "\n")
+                self.stream.flush()
+            if stop:
+                return
+
+    def _format(self, record):
+        try:
+            return self.formatter.format(record)
+        except Exception as e:
+            return _dumps({"level": "ERROR", "logger": record.name, "message": f"Falha ao formatar log: {e}"})
+
+    def restart_after_fork(self):
+        # Threads não sobrevivem ao fork: o filho do supervisor precisa da sua própria
+        self.handler.queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        self.handler.dropped = 0
+        self.start()
 
 log = logging.getLogger("ecs-task-gui")
 log.setLevel(logging.INFO)
 
-# Configurar handler para stdout
-stdout_handler = logging.StreamHandler()
-stdout_handler.setFormatter(JSONFormatter())  # Aplicar formatação JSON
-log.addHandler(stdout_handler)
+# Logs passam por uma fila e são formatados/escritos pela thread do LogWriter
+log_handler = TraceContextQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+log.addHandler(log_handler)
+log_writer = LogWriter(log_handler, JSONFormatter(), sys.stderr, LOG_BATCH_SIZE)
+log_writer.start()
+atexit.register(log_writer.stop)
+os.register_at_fork(after_in_child=log_writer.restart_after_fork)
 
 # Variáveis de Ambiente
 CHROMEDRIVER_PATH = os.getenv('CHROMEDRIVER_PATH', '/usr/local/bin/chromedriver')
@@ -59,106 +214,2161 @@ SQS_QUEUE_URL = os.getenv('SQS_QUEUE_URL')
 DLQ_URL = os.getenv('DLQ_URL')  
 AWS_REGION = os.getenv('AWS_REGION', 'sa-east-1')
 
-# Configurações do SQS
-MAX_NUMBER_OF_MESSAGES = 1  
-POLL_INTERVAL_SECONDS = int(os.getenv('POLL_INTERVAL_SECONDS', 5))
+# Configurações dos workers
+WORKER_CONCURRENCY = int(os.getenv('WORKER_CONCURRENCY', 1))
+PREFETCH_MESSAGES = int(os.getenv('PREFETCH_MESSAGES', 0))
+RECEIVE_CONCURRENCY = int(os.getenv('RECEIVE_CONCURRENCY', 2))  # Receives simultâneos em long polling
+STAGE_QUEUE_SIZE = int(os.getenv('STAGE_QUEUE_SIZE', 100))  # Limite das filas de ack e DLQ
+SHUTDOWN_GRACE_SECONDS = float(os.getenv('SHUTDOWN_GRACE_SECONDS', 25))  # Abaixo do stopTimeout do ECS (30s)
+SHUTDOWN_FORCE_WAIT_SECONDS = float(os.getenv('SHUTDOWN_FORCE_WAIT_SECONDS', 3))
+
+# Configurações do supervisor multi-processo (python script.py supervise)
+BROWSERS_PER_CORE = float(os.getenv('BROWSERS_PER_CORE', 1))
+GLOBAL_MAX_BROWSERS = int(os.getenv('GLOBAL_MAX_BROWSERS', max(1, int((os.cpu_count() or 1) * BROWSERS_PER_CORE))))
+CONSUMER_PROCESSES = int(os.getenv('CONSUMER_PROCESSES', max(1, math.ceil(GLOBAL_MAX_BROWSERS / max(1, WORKER_CONCURRENCY)))))
+SUPERVISOR_RESTART_DELAY_SECONDS = float(os.getenv('SUPERVISOR_RESTART_DELAY_SECONDS', 5))
+SUPERVISOR_DRAIN_SECONDS = float(os.getenv('SUPERVISOR_DRAIN_SECONDS', 120))
+
+# Configurações do SQS (receive_message aceita no máximo 10 mensagens)
+MAX_NUMBER_OF_MESSAGES = min(10, int(os.getenv('MAX_NUMBER_OF_MESSAGES', WORKER_CONCURRENCY)))
+RECEIVE_WAIT_TIME_SECONDS = min(20, int(os.getenv('RECEIVE_WAIT_TIME_SECONDS', 20)))  # Long polling (máx. 20s)
+POLL_BACKOFF_BASE_SECONDS = float(os.getenv('POLL_BACKOFF_BASE_SECONDS', 1))
+POLL_BACKOFF_MAX_SECONDS = float(os.getenv('POLL_BACKOFF_MAX_SECONDS', 60))
 VISIBILITY_TIMEOUT = int(os.getenv('VISIBILITY_TIMEOUT', 30))
+HEARTBEAT_INTERVAL_SECONDS = int(os.getenv('HEARTBEAT_INTERVAL_SECONDS', max(1, VISIBILITY_TIMEOUT // 3)))
+SQS_BATCH_SIZE = 10  # Limite das APIs *_batch do SQS
+ACK_FLUSH_INTERVAL_SECONDS = float(os.getenv('ACK_FLUSH_INTERVAL_SECONDS', 1))
+ACK_MAX_ATTEMPTS = int(os.getenv('ACK_MAX_ATTEMPTS', 3))
+SQS_BATCH_MAX_BYTES = 256 * 1024  # Limite de payload somado de send_message_batch
+DLQ_FLUSH_INTERVAL_SECONDS = float(os.getenv('DLQ_FLUSH_INTERVAL_SECONDS', 1))
+DLQ_MAX_ATTEMPTS = int(os.getenv('DLQ_MAX_ATTEMPTS', 3))
+MAX_PROCESSING_ATTEMPTS = int(os.getenv('MAX_PROCESSING_ATTEMPTS', 3))  # Entregas antes de ir para a DLQ
+
+# Configurações do pool de drivers
+DRIVER_POOL_SIZE = int(os.getenv('DRIVER_POOL_SIZE', WORKER_CONCURRENCY))
+DRIVER_MAX_JOBS = int(os.getenv('DRIVER_MAX_JOBS', 50))
+DRIVER_MAX_AGE_SECONDS = int(os.getenv('DRIVER_MAX_AGE_SECONDS', 1800))
+# Memória da árvore chromedriver + Chrome: PSS quando amostrado (RESOURCE_SAMPLE_PSS), senão RSS; 0 desliga
+DRIVER_MAX_MEMORY_MB = float(os.getenv('DRIVER_MAX_MEMORY_MB', 1536))
+# "pooled" reaproveita o driver (limpo) entre mensagens; "per_job" usa um navegador novo
+# por mensagem, com o próximo já sendo iniciado em segundo plano durante o job atual
+DRIVER_ISOLATION_MODES = ("pooled", "per_job")
+DRIVER_ISOLATION = os.getenv('DRIVER_ISOLATION', 'pooled')
+DRIVER_TMP_DIR = os.getenv('DRIVER_TMP_DIR')  # Base dos perfis temporários (padrão: tmp do sistema)
+CHROME_LAUNCH_PROFILE = os.getenv('CHROME_LAUNCH_PROFILE', 'headless-lean')
+
+# Controle adaptativo (AIMD) de navegadores simultâneos, entre ADAPTIVE_MIN_CONCURRENCY
+# e WORKER_CONCURRENCY, pela CPU do host, memória da task e memória (PSS) dos navegadores
+ADAPTIVE_CONCURRENCY = os.getenv('ADAPTIVE_CONCURRENCY', 'true').lower() == 'true'
+ADAPTIVE_MIN_CONCURRENCY = int(os.getenv('ADAPTIVE_MIN_CONCURRENCY', 1))
+ADAPTIVE_TARGET_CPU_PERCENT = float(os.getenv('ADAPTIVE_TARGET_CPU_PERCENT', 85))
+ADAPTIVE_TARGET_MEMORY_PERCENT = float(os.getenv('ADAPTIVE_TARGET_MEMORY_PERCENT', 80))
+ADAPTIVE_MAX_CHROME_RSS_MB = float(os.getenv('ADAPTIVE_MAX_CHROME_RSS_MB', 0))  # Soma do PSS; 0 desliga
+ADAPTIVE_SAMPLE_INTERVAL_SECONDS = float(os.getenv('ADAPTIVE_SAMPLE_INTERVAL_SECONDS', 5))
+ADAPTIVE_DECREASE_FACTOR = float(os.getenv('ADAPTIVE_DECREASE_FACTOR', 0.5))
+ADAPTIVE_COOLDOWN_SECONDS = float(os.getenv('ADAPTIVE_COOLDOWN_SECONDS', 15))  # Após uma redução
+
+# Amostragem em segundo plano da árvore chromedriver + Chrome de cada driver
+RESOURCE_SAMPLE_INTERVAL_SECONDS = float(os.getenv('RESOURCE_SAMPLE_INTERVAL_SECONDS', 2))
+RESOURCE_REPORT_INTERVAL_SECONDS = float(os.getenv('RESOURCE_REPORT_INTERVAL_SECONDS', 60))
+RESOURCE_SAMPLE_PSS = os.getenv('RESOURCE_SAMPLE_PSS', 'true').lower() == 'true'  # Lê /proc/<pid>/smaps_rollup
+
+# Estratégia de carga e timeouts do driver (sobrescrevíveis por tipo de job:
+# "page_load_strategy", "page_load_timeout", "script_timeout" e "implicit_wait")
+PAGE_LOAD_STRATEGIES = ("normal", "eager", "none")
+PAGE_LOAD_STRATEGY = os.getenv('PAGE_LOAD_STRATEGY', 'eager')
+PAGE_LOAD_TIMEOUT_SECONDS = float(os.getenv('PAGE_LOAD_TIMEOUT_SECONDS', 30))
+SCRIPT_TIMEOUT_SECONDS = float(os.getenv('SCRIPT_TIMEOUT_SECONDS', 10))
+IMPLICIT_WAIT_SECONDS = float(os.getenv('IMPLICIT_WAIT_SECONDS', 0))
+
+# Configurações de espera pela página
+WAIT_DEFAULT_TIMEOUT_SECONDS = float(os.getenv('WAIT_DEFAULT_TIMEOUT_SECONDS', 20))
+WAIT_POLL_SECONDS = float(os.getenv('WAIT_POLL_SECONDS', 0.25))
+WAIT_MAX_TIMEOUT_SECONDS = float(os.getenv('WAIT_MAX_TIMEOUT_SECONDS', 60))  # Teto do "timeout" de cada passo
+
+# Bloqueio de requisições via CDP (Network.setBlockedURLs). Categorias padrão e
+# padrões extras de URL (ex.: "*google-analytics.com*") separados por vírgula.
+BLOCKED_RESOURCE_TYPES = [t for t in os.getenv('BLOCKED_RESOURCE_TYPES', 'images,fonts,media').split(',') if t]
+BLOCKED_URL_PATTERNS = [p for p in os.getenv('BLOCKED_URL_PATTERNS', '').split(',') if p]
+
+# Executor HTTP (sem navegador) para tipos de job com "executor": "http"
+HTTP_USER_AGENT = os.getenv(
+    'HTTP_USER_AGENT',
+    'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36'
+)
+HTTP_TIMEOUT_SECONDS = float(os.getenv('HTTP_TIMEOUT_SECONDS', 30))
+
+# Cache de resultados por payload normalizado (TTL 0 desliga; "cache_ttl" no tipo de job sobrescreve)
+RESULT_CACHE_TTL_SECONDS = float(os.getenv('RESULT_CACHE_TTL_SECONDS', 300))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv('RESULT_CACHE_MAX_ENTRIES', 1000))
+RESULT_CACHE_PATH = os.getenv('RESULT_CACHE_PATH')  # Arquivo SQLite opcional para persistir o cache
+STORE_PRUNE_INTERVAL_SECONDS = float(os.getenv('STORE_PRUNE_INTERVAL_SECONDS', 60))  # Limpeza das tabelas SQLite
+
+# Deduplicação de entregas repetidas do SQS (por MessageId e hash do corpo)
+DEDUP_WINDOW_SECONDS = float(os.getenv('DEDUP_WINDOW_SECONDS', 3600))
+DEDUP_MAX_ENTRIES = int(os.getenv('DEDUP_MAX_ENTRIES', 10000))
+DEDUP_STORE_PATH = os.getenv('DEDUP_STORE_PATH')  # Arquivo SQLite opcional
+DEDUP_BY_CONTENT = os.getenv('DEDUP_BY_CONTENT', 'true').lower() == 'true'
+
+# Definições de job por tipo (JSON). O payload da mensagem pode sobrescrever "waits";
+# "block_resources" e "blocked_urls" substituem os padrões acima para o tipo de job.
+# "executor" escolhe entre "browser" (padrão) e "http"; no http, "http_expect" é um
+# texto que precisa aparecer na resposta, senão o job cai para o navegador.
+DEFAULT_JOB_DEFINITIONS = {
+    "default": {
+        "waits": [{"type": "ready_state", "state": "complete"}],
+    },
+}
+JOB_DEFINITIONS = {**DEFAULT_JOB_DEFINITIONS, **json.loads(os.getenv('JOB_DEFINITIONS', '{}'))}
 
 sqs_client = boto3.client('sqs', region_name=AWS_REGION)
 
+# Perfis de inicialização do Chrome. "headless-lean" é o de produção; os perfis
+# "*-debug" mantêm o log verboso do Chrome ("headed-debug" exige display, ex.: xvfb).
+_LEAN_FLAGS = [
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-sync",
+    "--disable-default-apps",
+    "--disable-component-update",
+    "--disable-client-side-phishing-detection",
+    "--disable-features=Translate,OptimizationHints,MediaRouter,AutofillServerCommunication",
+    "--disable-background-timer-throttling",
+    "--disable-backgrounding-occluded-windows",
+    "--disable-renderer-backgrounding",
+    "--no-first-run",
+    "--mute-audio",
+]
+LAUNCH_PROFILES = {
+    "headless-lean": [
+        "--headless=new",
+        "--window-size=1280,800",
+        "--disable-logging",
+        "--log-level=3",
+    ] + _LEAN_FLAGS,
+    "headless-debug": [
+        "--headless=new",
+        "--window-size=1280,800",
+        "--enable-logging",
+        "--log-level=0",
+    ] + _LEAN_FLAGS,
+    "headed-debug": [
+        "--window-size=500,500",
+        "--disable-extensions",
+        "--enable-logging",
+        "--log-level=0",
+        "--disable-background-networking",
+        "--disable-sync",
+        "--start-maximized",
+    ],
+}
+if CHROME_LAUNCH_PROFILE not in LAUNCH_PROFILES:
+    raise ValueError(f"CHROME_LAUNCH_PROFILE desconhecido: {CHROME_LAUNCH_PROFILE!r}")
+if PAGE_LOAD_STRATEGY not in PAGE_LOAD_STRATEGIES:
+    raise ValueError(f"PAGE_LOAD_STRATEGY desconhecida: {PAGE_LOAD_STRATEGY!r}")
+if DRIVER_ISOLATION not in DRIVER_ISOLATION_MODES:
+    raise ValueError(f"DRIVER_ISOLATION desconhecido: {DRIVER_ISOLATION!r}")
+
 @tracer.wrap("setup_driver")
-def setup_driver():
+def setup_driver(launch_profile=CHROME_LAUNCH_PROFILE, page_load_strategy=PAGE_LOAD_STRATEGY):
+    # Perfil e cache exclusivos: navegadores em paralelo não disputam lock
+    profile_dir = tempfile.mkdtemp(prefix="chrome-profile-", dir=DRIVER_TMP_DIR)
+
     chrome_options = Options()
     chrome_options.binary_location = CHROME_BINARY_PATH
+    chrome_options.page_load_strategy = page_load_strategy
     chrome_options.add_argument("--no-sandbox")
     chrome_options.add_argument("--disable-dev-shm-usage")
     chrome_options.add_argument("--disable-gpu")
-    chrome_options.add_argument("--window-size=500,500")
-    chrome_options.add_argument("--disable-extensions")
-    chrome_options.add_argument("--user-data-dir=/tmp")
-    chrome_options.add_argument("--disk-cache-dir=/tmp")
-    chrome_options.add_argument("--enable-logging")
-    chrome_options.add_argument("--log-level=0")
-    chrome_options.add_argument("--disable-background-networking")
-    chrome_options.add_argument("--disable-sync")
-    chrome_options.add_argument("--start-maximized")
-    chrome_options.add_argument("--remote-debugging-port=9222")
+    chrome_options.add_argument(f"--user-data-dir={profile_dir}")
+    chrome_options.add_argument(f"--disk-cache-dir={os.path.join(profile_dir, 'cache')}")
+    # Porta 0: o próprio Chrome escolhe uma porta livre ao fazer o bind e a publica em
+    # DevToolsActivePort no perfil, de onde o chromedriver a lê; sem corrida entre drivers
+    chrome_options.add_argument("--remote-debugging-port=0")
+    for argument in LAUNCH_PROFILES[launch_profile]:
+        chrome_options.add_argument(argument)
 
     service = Service(CHROMEDRIVER_PATH)
-    driver = webdriver.Chrome(service=service, options=chrome_options)
-    log.info("Driver configurado com sucesso.")
+    try:
+        driver = webdriver.Chrome(service=service, options=chrome_options)
+    except Exception:
+        shutil.rmtree(profile_dir, ignore_errors=True)
+        raise
+    driver.profile_dir = profile_dir
+    try:
+        install_network_tracker(driver)
+    except Exception:
+        teardown_driver(driver)
+        raise
+    log.info(
+        "Driver configurado com sucesso.",
+        extra={
+            "debugger_address": driver.capabilities.get("goog:chromeOptions", {}).get("debuggerAddress"),
+            "launch_profile": launch_profile,
+        }
+    )
     return driver
 
-@tracer.wrap("process_message")
-def process_message(message):
-    body = message.get('Body', '')
-    receipt_handle = message['ReceiptHandle']
+def install_network_tracker(driver):
+    """Contador de fetch/XHR em andamento usado pela espera network_idle, em todo documento novo da aba."""
+    driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": NETWORK_TRACKER_SCRIPT})
 
-    if not body or len(body.strip()) == 0:
-        log.warning("Mensagem vazia ou inválida. Ignorando.")
-        return
+def teardown_driver(driver):
+    """Encerra o navegador e remove o perfil temporário criado por setup_driver."""
+    try:
+        driver.quit()
+    finally:
+        profile_dir = getattr(driver, "profile_dir", None)
+        if profile_dir:
+            shutil.rmtree(profile_dir, ignore_errors=True)
 
-    driver = setup_driver()
-    request_id = str(uuid.uuid4())
+def driver_process_tree(driver):
+    """O processo do chromedriver e todos os processos Chrome filhos."""
+    root = psutil.Process(driver.service.process.pid)
+    return [root] + root.children(recursive=True)
+
+def process_tree_usage(processes):
+    """RSS e PSS (bytes), tempo de CPU (s) e descritores abertos somados dos processos."""
+    usage = {"rss": 0, "pss": 0, "cpu_seconds": 0.0, "open_fds": 0}
+    for process in processes:
+        try:
+            with process.oneshot():
+                memory = process.memory_full_info() if RESOURCE_SAMPLE_PSS else process.memory_info()
+                cpu = process.cpu_times()
+                usage["rss"] += memory.rss
+                usage["pss"] += getattr(memory, "pss", 0)
+                usage["cpu_seconds"] += cpu.user + cpu.system
+                usage["open_fds"] += process.num_fds()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            pass
+    return usage
+
+def driver_tree_rss(driver):
+    """RSS somado (bytes) do chromedriver e de todos os processos Chrome filhos."""
+    total = 0
+    for process in driver_process_tree(driver):
+        try:
+            total += process.memory_info().rss
+        except psutil.NoSuchProcess:
+            pass
+    return total
+
+def _read_cgroup_int(path):
+    with open(path) as f:
+        value = f.read().strip()
+    return None if value == "max" else int(value)
+
+def _cgroup_inactive_file(path, key):
+    with open(path) as f:
+        for line in f:
+            name, _, value = line.partition(" ")
+            if name == key:
+                return int(value)
+    return 0
+
+def memory_usage():
+    """
+    Memória usada e limite (bytes) do cgroup da task, sem o page cache inativo que o
+    kernel recupera antes de um OOM kill. Fora de um cgroup com limite, usa os do host.
+    """
+    host_total = psutil.virtual_memory().total
+    for current, limit, stat, key in (
+        ("/sys/fs/cgroup/memory.current", "/sys/fs/cgroup/memory.max",
+         "/sys/fs/cgroup/memory.stat", "inactive_file"),
+        ("/sys/fs/cgroup/memory/memory.usage_in_bytes", "/sys/fs/cgroup/memory/memory.limit_in_bytes",
+         "/sys/fs/cgroup/memory/memory.stat", "total_inactive_file"),
+    ):
+        try:
+            limit_bytes = _read_cgroup_int(limit)
+            # cgroup v1 sem limite reporta um valor enorme
+            if limit_bytes is None or limit_bytes >= host_total:
+                continue
+            used = _read_cgroup_int(current) - _cgroup_inactive_file(stat, key)
+        except (OSError, ValueError):
+            continue
+        return max(0, used), limit_bytes
+    vm = psutil.virtual_memory()
+    return vm.total - vm.available, vm.total
+
+def benchmark_launch_profiles(runs=3):
+    """
+    Mede, para cada perfil de inicialização, o tempo de launch, o RSS da árvore de
+    processos e o tempo de carga de WEBSITE_URL (python script.py benchmark-profiles [runs]).
+    Perfis com interface são pulados sem DISPLAY; falhas de um perfil vão para o resultado.
+    """
+    runs = max(1, runs)
+    results = {}
+    for name, arguments in LAUNCH_PROFILES.items():
+        if not any(a.startswith("--headless") for a in arguments) and not os.getenv("DISPLAY"):
+            results[name] = {"skipped": "DISPLAY não definido"}
+            log.info(f"Benchmark do perfil {name} pulado: exige display.")
+            continue
+        launches, loads, rss = [], [], []
+        try:
+            for _ in range(runs):
+                start_time = time.monotonic()
+                driver = setup_driver(name)
+                launches.append(time.monotonic() - start_time)
+                try:
+                    start_time = time.monotonic()
+                    driver.get(WEBSITE_URL)
+                    loads.append(time.monotonic() - start_time)
+                    rss.append(driver_tree_rss(driver) / 1024 / 1024)
+                finally:
+                    teardown_driver(driver)
+        except Exception as e:
+            results[name] = {"error": str(e) or type(e).__name__}
+            log.error(f"Falha no benchmark do perfil {name}", extra={"exception": str(e)})
+            continue
+        results[name] = {
+            "launch_seconds": sum(launches) / runs,
+            "page_load_seconds": sum(loads) / runs,
+            "rss_mb": sum(rss) / runs,
+        }
+        log.info(f"Benchmark do perfil {name}", extra=results[name])
+    print(json.dumps(results, indent=2))
+    return results
+
+class PooledDriver:
+    """Driver Chrome mantido aquecido pelo pool, com contadores para reciclagem."""
+    def __init__(self, driver, page_load_strategy):
+        self.driver = driver
+        self.page_load_strategy = page_load_strategy
+        self.created_at = time.monotonic()
+        self.jobs = 0
+        self.healthy = True
+        self.usage = None  # Última amostra da árvore de processos (ResourceSampler)
+        self.replacement = None  # None, "pending" (substituto subindo) ou "ready"
+        self.retire_reason = None
+        self.job_usage = None  # Picos do job atual, mantidos pelo ResourceSampler
+
+    def memory_bytes(self):
+        """
+        PSS da última amostra, que divide as páginas compartilhadas entre os processos
+        do Chrome em vez de contá-las uma vez por processo como o RSS somado; sem PSS, o RSS.
+        """
+        usage = self.usage or {}
+        return usage.get("pss") or usage.get("rss", 0)
+
+    def recycle_reason(self, max_jobs, max_age_seconds, max_memory_bytes):
+        """Motivo para trocar o driver por um novo, ou None se ele ainda pode ser reaproveitado."""
+        if self.jobs >= max_jobs:
+            return "max_jobs"
+        if time.monotonic() - self.created_at >= max_age_seconds:
+            return "max_age"
+        if max_memory_bytes and self.memory_bytes() >= max_memory_bytes:
+            return "max_memory"
+        return None
+
+    def alive(self):
+        """O chromedriver ainda está de pé (o Chrome caído é detectado pelo ResourceSampler)."""
+        process = getattr(self.driver.service, "process", None)
+        return process is not None and process.poll() is None
+
+class DriverPool:
+    """
+    Pool limitado de drivers Chrome reaproveitados entre mensagens.
+    Cada mensagem aluga um driver, que é limpo (cookies, storage, abas) na devolução
+    e reciclado após DRIVER_MAX_JOBS mensagens, DRIVER_MAX_AGE_SECONDS segundos ou
+    DRIVER_MAX_MEMORY_MB de memória. O substituto é iniciado em segundo plano e o driver
+    antigo continua atendendo até ele ficar pronto; drivers que caíram ou não
+    respondem à limpeza são descartados na hora e substituídos também em segundo plano.
+
+    Com isolated=True (DRIVER_ISOLATION=per_job) nenhum driver atende duas mensagens:
+    prefetch() inicia o navegador da próxima mensagem enquanto o job atual roda, e o
+    driver usado é encerrado na devolução, sem limpeza.
+    """
+    def __init__(self, size, max_jobs, max_age_seconds, max_memory_bytes, isolated=False):
+        self.size = max(1, size)
+        self.max_jobs = max(1, max_jobs)
+        self.max_age_seconds = max_age_seconds
+        self.max_memory_bytes = max_memory_bytes
+        self.isolated = isolated
+        self._idle = []
+        self._leased = set()
+        self._total = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def warm(self, stop_requested=None):
+        """
+        Inicia os drivers do pool antecipadamente para tirar o cold start do caminho da
+        mensagem. Para entre um launch e outro se stop_requested (threading.Event) for setado.
+        """
+        leased = []
+        try:
+            for _ in range(self.size):
+                if stop_requested is not None and stop_requested.is_set():
+                    break
+                leased.append(self.acquire())
+        finally:
+            for pooled in leased:
+                self.release(pooled, used=False)
+
+    def acquire(self, page_load_strategy=PAGE_LOAD_STRATEGY):
+        """
+        Aluga um driver ocioso com a estratégia de carga pedida, criando um novo se o
+        pool ainda não estiver cheio. Com o pool cheio e só drivers ociosos de outra
+        estratégia, um deles é substituído.
+        """
+        stale = []
+        pooled = None
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Pool de drivers encerrado.")
+                for candidate in [c for c in self._idle if not c.alive()]:
+                    self._idle.remove(candidate)
+                    self._total -= 1
+                    candidate.retire_reason = "crashed"
+                    stale.append(candidate)
+                for candidate in self._idle:
+                    self._schedule_recycle(candidate)
+                matching = [c for c in self._idle if c.page_load_strategy == page_load_strategy]
+                if matching:
+                    # Preferir drivers que não estão de saída
+                    pooled = ([c for c in matching if c.replacement is None] or matching)[-1]
+                    self._idle.remove(pooled)
+                    self._leased.add(pooled)
+                    break
+                if self._total < self.size:
+                    self._total += 1
+                    break
+                if self._idle:
+                    # A vaga do driver substituído passa para o novo
+                    candidate = self._idle.pop(0)
+                    candidate.retire_reason = "page_load_strategy"
+                    stale.append(candidate)
+                    break
+                self._cond.wait()
+
+        # Encerrar drivers descartados fora do lock para não bloquear outros workers
+        for candidate in stale:
+            self._retire(candidate)
+        if pooled:
+            return pooled
+
+        try:
+            pooled = PooledDriver(setup_driver(page_load_strategy=page_load_strategy), page_load_strategy)
+        except Exception:
+            with self._cond:
+                self._total -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._leased.add(pooled)
+        return pooled
+
+    def release(self, pooled, used=True):
+        """
+        Devolve o driver ao pool. Um driver que falhou ou não pôde ser limpo é descartado
+        e substituído em segundo plano; um que atingiu o limite de reciclagem volta ao
+        pool até o substituto ficar pronto. used=False (aquecimento) não conta como job.
+        """
+        if used:
+            pooled.jobs += 1
+            if self.isolated:
+                pooled.retire_reason = pooled.retire_reason or "per_job"
+        keep = (
+            pooled.healthy and not self._closed and pooled.replacement != "ready"
+            and not (self.isolated and used)
+        )
+        if keep:
+            try:
+                reset_driver(pooled.driver)
+            except Exception as e:
+                log.warning(f"Falha ao limpar driver, descartando: {e}")
+                pooled.retire_reason = "unresponsive"
+                keep = False
+
+        with self._cond:
+            self._leased.discard(pooled)
+            if keep and not self._closed:
+                self._idle.append(pooled)
+                self._schedule_recycle(pooled)
+            else:
+                self._total -= 1
+                keep = False
+                if pooled.replacement is None:
+                    pooled.retire_reason = pooled.retire_reason or ("shutdown" if self._closed else "unhealthy")
+                    self._spawn_replacement(pooled)
+            self._cond.notify()
+
+        if not keep:
+            self._retire(pooled)
+
+    def prefetch(self, pooled):
+        """No modo isolado, começa a subir o navegador da próxima mensagem enquanto este job roda."""
+        if not self.isolated:
+            return
+        with self._cond:
+            if pooled.replacement is None:
+                self._spawn_replacement(pooled)
 
+    def discard(self, pooled, reason):
+        """Tira do pool um driver ocioso que caiu (visto pelo ResourceSampler) e o substitui."""
+        with self._cond:
+            if pooled not in self._idle:
+                pooled.healthy = False  # Alugado: sai na devolução
+                return
+            self._idle.remove(pooled)
+            self._total -= 1
+            pooled.retire_reason = reason
+            if pooled.replacement is None:
+                self._spawn_replacement(pooled)
+            self._cond.notify()
+        self._retire(pooled)
+
+    def maintain(self):
+        """Agenda a troca dos drivers ociosos que passaram de algum limite (chamado pelo ResourceSampler)."""
+        with self._cond:
+            for pooled in self._idle:
+                self._schedule_recycle(pooled)
+
+    def _schedule_recycle(self, pooled):
+        # Chamado com o lock: o driver continua em uso até o substituto ficar pronto
+        if pooled.replacement is not None or self._closed:
+            return
+        reason = pooled.recycle_reason(self.max_jobs, self.max_age_seconds, self.max_memory_bytes)
+        if reason:
+            pooled.retire_reason = reason
+            self._spawn_replacement(pooled)
+
+    def _spawn_replacement(self, old):
+        # Chamado com o lock; a vaga do substituto fica reservada até ele subir
+        if self._closed:
+            return
+        old.replacement = "pending"
+        self._total += 1
+        threading.Thread(target=self._replace, args=(old,), name="driver-replace", daemon=True).start()
+
+    def _replace(self, old):
+        try:
+            new = PooledDriver(setup_driver(page_load_strategy=old.page_load_strategy), old.page_load_strategy)
+        except Exception as e:
+            log.error("Falha ao iniciar driver substituto.", extra={"exception": str(e)})
+            with self._cond:
+                self._total -= 1
+                # Um driver ainda em uso tenta de novo na próxima verificação
+                old.replacement = None
+                self._cond.notify()
+            return
+
+        retire = []
+        with self._cond:
+            old.replacement = "ready"
+            if self._closed:
+                self._total -= 1
+                retire.append(new)
+            else:
+                self._idle.append(new)
+                if old in self._idle:
+                    # Ocioso: sai agora; alugado: sai na devolução
+                    self._idle.remove(old)
+                    self._total -= 1
+                    retire.append(old)
+            self._cond.notify()
+        for pooled in retire:
+            self._retire(pooled)
+
+    def total(self):
+        with self._cond:
+            return self._total
+
+    def drivers(self):
+        """Drivers vivos do pool, ociosos e alugados."""
+        with self._cond:
+            return self._idle + list(self._leased)
+
+    def trim(self, keep):
+        """Encerra drivers ociosos até restarem no máximo keep drivers no pool."""
+        with self._cond:
+            excess = self._idle[:max(0, self._total - keep)]
+            del self._idle[:len(excess)]
+            self._total -= len(excess)
+        for pooled in excess:
+            pooled.retire_reason = "concurrency_limit"
+            self._retire(pooled)
+
+    def shutdown(self, force=False):
+        """
+        Encerra todos os drivers ociosos; drivers alugados são encerrados na devolução,
+        ou imediatamente com force=True (fim do prazo de encerramento).
+        """
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._total -= len(idle)
+            leased = list(self._leased) if force else []
+            self._cond.notify_all()
+        for pooled in idle + leased:
+            pooled.retire_reason = pooled.retire_reason or "shutdown"
+            self._retire(pooled)
+
+    def _retire(self, pooled):
+        try:
+            teardown_driver(pooled.driver)
+        except Exception as e:
+            log.warning(f"Falha ao encerrar driver: {e}")
+        log.info("Driver reciclado.", extra={"driver_jobs": pooled.jobs, "reason": pooled.retire_reason})
+
+# URLs dos iframes da página, inclusive os já removidos do DOM
+IFRAME_URLS_SCRIPT = """
+return performance.getEntriesByType('resource')
+  .filter(function (entry) { return entry.initiatorType === 'iframe'; })
+  .map(function (entry) { return entry.name; });
+"""
+
+def _frame_origins(frame_tree):
+    origins = [frame_tree["frame"].get("securityOrigin", "")]
+    for child in frame_tree.get("childFrames", []):
+        origins.extend(_frame_origins(child))
+    return origins
+
+def touched_origins(driver):
+    """
+    Origens http(s) que o job usou na aba atual: frames e iframes (inclusive removidos) e
+    o histórico de navegação, que guarda as páginas intermediárias de redirecionamentos
+    feitos por script. Redirecionamentos HTTP não rodam script: só deixam cookies.
+    """
+    urls = _frame_origins(driver.execute_cdp_cmd("Page.getFrameTree", {})["frameTree"])
+    urls += [entry["url"] for entry in driver.execute_cdp_cmd("Page.getNavigationHistory", {})["entries"]]
+    urls += driver.execute_script(IFRAME_URLS_SCRIPT) or []
+    origins = set()
+    for url in urls:
+        parsed = urlparse(url)
+        if parsed.scheme in ("http", "https") and parsed.hostname:
+            port = f":{parsed.port}" if parsed.port else ""
+            origins.add(f"{parsed.scheme}://{parsed.hostname}{port}")
+    return origins
+
+def reset_driver(driver):
+    """
+    Troca as abas do job por uma aba nova (sessionStorage e histórico zerados) e limpa
+    cookies, cache e o storage de cada origem tocada em qualquer aba: localStorage,
+    IndexedDB, Cache Storage, service workers etc. Qualquer falha propaga e o pool
+    descarta o driver em vez de reaproveitá-lo com dados do job anterior.
+    """
+    handles = driver.window_handles
+    origins = set()
+    for handle in handles:
+        driver.switch_to.window(handle)
+        origins |= touched_origins(driver)
+    driver.switch_to.new_window("tab")
+    fresh = driver.current_window_handle
+    for handle in handles:
+        driver.switch_to.window(handle)
+        driver.close()
+    driver.switch_to.window(fresh)
+    install_network_tracker(driver)  # Registrado por aba: a aba nova ainda não tem
+    for origin in origins:
+        driver.execute_cdp_cmd("Storage.clearDataForOrigin", {"origin": origin, "storageTypes": "all"})
+    driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+    driver.execute_cdp_cmd("Network.clearBrowserCache", {})
+
+driver_pool = DriverPool(
+    DRIVER_POOL_SIZE, DRIVER_MAX_JOBS, DRIVER_MAX_AGE_SECONDS, DRIVER_MAX_MEMORY_MB * 1024 * 1024,
+    isolated=DRIVER_ISOLATION == "per_job"
+)
+
+class ConcurrencyController:
+    """
+    Limite adaptativo (AIMD) de navegadores alugados ao mesmo tempo. A cada intervalo
+    amostra a CPU do host, a memória da task e a memória dos navegadores (PSS da última
+    amostra do ResourceSampler, sem percorrer a árvore de novo): com algum alvo estourado
+    o limite cai multiplicativamente e os drivers ociosos excedentes são encerrados;
+    abaixo dos alvos, com o limite saturado e folga para mais um navegador, sobe de um em um.
+    """
+    def __init__(self, maximum, minimum, interval):
+        self.maximum = max(1, maximum)
+        self.minimum = min(self.maximum, max(1, minimum))
+        self.limit = self.maximum
+        self.interval = interval
+        self.in_use = 0
+        self._saturated = False
+        self._decreased_at = float("-inf")
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_use >= self.limit:
+                if self._closed:
+                    raise RuntimeError("Controle de concorrência encerrado.")
+                self._saturated = True
+                self._cond.wait()
+            self.in_use += 1
+            self._saturated = self._saturated or self.in_use >= self.limit
+
+    def release(self):
+        with self._cond:
+            self.in_use -= 1
+            self._cond.notify()
+
+    def close(self):
+        """Libera as threads esperando vaga (encerramento forçado)."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await loop.run_in_executor(None, self.adjust)
+            except Exception as e:
+                log.error("Erro no controle de concorrência.", extra={"exception": str(e)})
+
+    def sample(self):
+        used, total = memory_usage()
+        # O RSS somado conta uma vez por processo as páginas compartilhadas entre os
+        # processos do Chrome e superestima o custo de mais um navegador
+        sampled = [pooled for pooled in driver_pool.drivers() if pooled.usage is not None]
+        chrome_memory = sum(pooled.memory_bytes() for pooled in sampled)
+        browsers = max(1, len(sampled))
+        return {
+            "cpu_percent": psutil.cpu_percent(interval=None),
+            "memory_percent": used / total * 100,
+            "chrome_memory_mb": chrome_memory / 1024 / 1024,
+            "browser_memory_percent": chrome_memory / browsers / total * 100,
+            "browser_memory_mb": chrome_memory / browsers / 1024 / 1024,
+        }
+
+    def adjust(self):
+        usage = self.sample()
+        over = [
+            name for name, value, target in (
+                ("cpu", usage["cpu_percent"], ADAPTIVE_TARGET_CPU_PERCENT),
+                ("memory", usage["memory_percent"], ADAPTIVE_TARGET_MEMORY_PERCENT),
+                ("chrome_memory", usage["chrome_memory_mb"], ADAPTIVE_MAX_CHROME_RSS_MB or float("inf")),
+            )
+            if value > target
+        ]
+        # Mais um navegador precisa caber nos alvos de memória
+        headroom = (
+            usage["memory_percent"] + usage["browser_memory_percent"] <= ADAPTIVE_TARGET_MEMORY_PERCENT
+            and (not ADAPTIVE_MAX_CHROME_RSS_MB
+                 or usage["chrome_memory_mb"] + usage["browser_memory_mb"] <= ADAPTIVE_MAX_CHROME_RSS_MB)
+        )
+
+        now = time.monotonic()
+        with self._cond:
+            previous = self.limit
+            if now - self._decreased_at >= ADAPTIVE_COOLDOWN_SECONDS:
+                if over:
+                    self.limit = max(self.minimum, int(self.limit * ADAPTIVE_DECREASE_FACTOR))
+                elif self._saturated and headroom:
+                    self.limit = min(self.maximum, self.limit + 1)
+                    self._cond.notify()
+            if self.limit < previous:
+                self._decreased_at = now
+            self._saturated = self.in_use >= self.limit
+            in_use = self.in_use
+
+        if self.limit != previous:
+            log.info(
+                "Limite de navegadores simultâneos ajustado.",
+                extra={
+                    "limit": self.limit, "previous_limit": previous, "in_use": in_use,
+                    "over_target": ",".join(over), **usage
+                }
+            )
+        if self.limit < previous:
+            driver_pool.trim(self.limit)
+
+concurrency_controller = ConcurrencyController(
+    WORKER_CONCURRENCY, ADAPTIVE_MIN_CONCURRENCY, ADAPTIVE_SAMPLE_INTERVAL_SECONDS
+)
+
+class ResourceSampler:
+    """
+    Thread que amostra periodicamente a árvore de processos de cada driver do pool
+    (RSS, PSS, CPU e FDs), acumula os picos no job que está usando o driver e
+    publica os totais como log de gauges a cada RESOURCE_REPORT_INTERVAL_SECONDS.
+    No job, begin_job/end_job só leem o tempo de CPU da árvore; memória e FDs ficam
+    com a thread, sem o cpu_percent(interval) bloqueante no caminho da mensagem.
+    """
+    def __init__(self, interval, report_interval):
+        self.interval = interval
+        self.report_interval = report_interval
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._reported_at = time.monotonic()
+
+    def start(self):
+        if self.interval <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="resource-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample_all()
+            except Exception as e:
+                log.error("Erro na amostragem de recursos.", extra={"exception": str(e)})
+
+    def sample(self, pooled):
+        """Amostra a árvore do driver e atualiza os picos do job em andamento."""
+        try:
+            processes = driver_process_tree(pooled.driver)
+        except (psutil.NoSuchProcess, AttributeError):
+            processes = []
+        if len(processes) < 2:
+            # Sem chromedriver ou sem Chrome embaixo dele: o navegador caiu
+            driver_pool.discard(pooled, "crashed")
+            return None
+        usage = process_tree_usage(processes)
+        pooled.usage = usage
+        with self._lock:
+            job_usage = pooled.job_usage
+            if job_usage is not None:
+                for key in ("rss", "pss", "open_fds"):
+                    job_usage[f"{key}_peak"] = max(job_usage[f"{key}_peak"], usage[key])
+                job_usage["cpu_seconds_end"] = usage["cpu_seconds"]
+        return usage
+
+    def sample_all(self):
+        totals = {"browsers": 0, "rss": 0, "pss": 0, "cpu_seconds": 0.0, "open_fds": 0}
+        for pooled in driver_pool.drivers():
+            usage = self.sample(pooled)
+            if usage is None:
+                continue
+            totals["browsers"] += 1
+            for key, value in usage.items():
+                totals[key] += value
+        # Com a memória atualizada, trocar os drivers ociosos que passaram do limite
+        driver_pool.maintain()
+
+        now = time.monotonic()
+        if now - self._reported_at >= self.report_interval:
+            self._reported_at = now
+            log.info(
+                "Uso de recursos dos navegadores.",
+                extra={
+                    "browsers": totals["browsers"],
+                    "chrome_rss_mb": totals["rss"] / 1024 / 1024,
+                    "chrome_pss_mb": totals["pss"] / 1024 / 1024,
+                    "chrome_cpu_seconds": totals["cpu_seconds"],
+                    "chrome_open_fds": totals["open_fds"],
+                }
+            )
+        return totals
+
+    @staticmethod
+    def tree_cpu_seconds(pooled):
+        """Só o tempo de CPU somado da árvore do driver (leitura barata, usada no início e fim do job)."""
+        try:
+            processes = driver_process_tree(pooled.driver)
+        except (psutil.NoSuchProcess, AttributeError):
+            return None
+        total = 0.0
+        for process in processes:
+            try:
+                cpu = process.cpu_times()
+                total += cpu.user + cpu.system
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                pass
+        return total
+
+    def begin_job(self, pooled):
+        # Picos partem da última amostra da thread; jobs curtos ficam com ela
+        last = pooled.usage or {}
+        cpu_seconds = self.tree_cpu_seconds(pooled)
+        with self._lock:
+            pooled.job_usage = {
+                "rss_peak": last.get("rss", 0),
+                "pss_peak": last.get("pss", 0),
+                "open_fds_peak": last.get("open_fds", 0),
+                "cpu_seconds_start": cpu_seconds,
+                "cpu_seconds_end": None,
+            }
+
+    def end_job(self, pooled, span=None):
+        """Fecha a contabilidade do job no driver e grava os totais como métricas do span."""
+        cpu_seconds = self.tree_cpu_seconds(pooled)
+        with self._lock:
+            job_usage, pooled.job_usage = pooled.job_usage, None
+        if not job_usage:
+            return None
+        if cpu_seconds is not None:
+            job_usage["cpu_seconds_end"] = cpu_seconds
+        metrics = {
+            "chrome.rss_peak_mb": job_usage["rss_peak"] / 1024 / 1024,
+            "chrome.pss_peak_mb": job_usage["pss_peak"] / 1024 / 1024,
+            "chrome.open_fds_peak": job_usage["open_fds_peak"],
+        }
+        if job_usage["cpu_seconds_start"] is not None and job_usage["cpu_seconds_end"] is not None:
+            # Renderers que morreram no meio do job levam o tempo de CPU junto
+            metrics["chrome.cpu_seconds"] = max(0.0, job_usage["cpu_seconds_end"] - job_usage["cpu_seconds_start"])
+        if span is not None:
+            for name, value in metrics.items():
+                span.set_metric(name, value)
+        return metrics
+
+resource_sampler = ResourceSampler(RESOURCE_SAMPLE_INTERVAL_SECONDS, RESOURCE_REPORT_INTERVAL_SECONDS)
+
+# Condições de espera declarativas. Cada passo é um dict com "type", "timeout"
+# opcional e os parâmetros da condição, por exemplo:
+#   {"type": "element_visible", "by": "css", "selector": "#conteudo", "timeout": 10}
+READY_STATES = ("loading", "interactive", "complete")
+
+LOCATOR_STRATEGIES = {
+    "css": By.CSS_SELECTOR,
+    "xpath": By.XPATH,
+    "id": By.ID,
+    "name": By.NAME,
+}
+
+# Instalado em todo documento novo por setup_driver: conta as requisições fetch/XHR em
+# andamento e amplia o buffer de resource timing (250 entradas por padrão), que lotado
+# deixa de registrar os recursos concluídos
+NETWORK_TRACKER_SCRIPT = """
+(function () {
+  if (window.__pendingRequests !== undefined) { return; }
+  window.__pendingRequests = 0;
+  window.__requestActivityAt = 0;
+  if (performance.setResourceTimingBufferSize) { performance.setResourceTimingBufferSize(100000); }
+  function started() { window.__pendingRequests++; window.__requestActivityAt = performance.now(); }
+  function finished() {
+    window.__pendingRequests = Math.max(0, window.__pendingRequests - 1);
+    window.__requestActivityAt = performance.now();
+  }
+  if (window.fetch) {
+    var fetch = window.fetch;
+    window.fetch = function () {
+      started();
+      var result;
+      try { result = fetch.apply(this, arguments); } catch (e) { finished(); throw e; }
+      result.then(finished, finished);
+      return result;
+    };
+  }
+  var send = XMLHttpRequest.prototype.send;
+  XMLHttpRequest.prototype.send = function () {
+    started();
+    this.addEventListener('loadend', finished);
+    try { return send.apply(this, arguments); } catch (e) {
+      this.removeEventListener('loadend', finished);
+      finished();
+      throw e;
+    }
+  };
+})();
+"""
+
+# Aproximação: a página está ociosa quando não há fetch/XHR em andamento e nenhuma
+# requisição começou ou terminou nos últimos idle_ms. Imagens, scripts e demais
+# recursos fora de fetch/XHR (e WebSockets) só entram pelo resource timing, ou seja,
+# depois de concluídos; um recurso lento ainda em andamento não impede a ociosidade.
+NETWORK_IDLE_SCRIPT = """
+if (document.readyState !== 'complete') { return false; }
+if (window.__pendingRequests > 0) { return false; }
+var entries = performance.getEntriesByType('resource');
+var last = window.__requestActivityAt || 0;
+for (var i = 0; i < entries.length; i++) { last = Math.max(last, entries[i].responseEnd); }
+return performance.now() - last >= arguments[0];
+"""
+
+def _locator(step):
+    return (LOCATOR_STRATEGIES[step.get("by", "css")], step["selector"])
+
+def _ready_state_condition(step):
+    target = READY_STATES.index(step.get("state", "complete"))
+    def condition(driver):
+        state = driver.execute_script("return document.readyState")
+        return state in READY_STATES and READY_STATES.index(state) >= target
+    return condition
+
+def _network_idle_condition(step):
+    # Ver NETWORK_IDLE_SCRIPT: sem fetch/XHR pendente nem atividade de rede nos últimos idle_ms
+    idle_ms = int(step.get("idle_ms", 500))
+    return lambda driver: driver.execute_script(NETWORK_IDLE_SCRIPT, idle_ms)
+
+def _js_condition(step):
+    return lambda driver: driver.execute_script(step["script"])
+
+WAIT_CONDITIONS = {
+    "element_present": lambda step: EC.presence_of_element_located(_locator(step)),
+    "element_visible": lambda step: EC.visibility_of_element_located(_locator(step)),
+    "ready_state": _ready_state_condition,
+    "network_idle": _network_idle_condition,
+    "js": _js_condition,
+}
+
+def run_wait_steps(driver, steps):
+    """Executa os passos de espera em ordem; cada um falha com TimeoutException ao estourar seu timeout."""
+    for step in steps:
+        kind = step["type"]
+        timeout = float(step.get("timeout", WAIT_DEFAULT_TIMEOUT_SECONDS))
+        with tracer.trace("selenium.wait", resource=kind) as span:
+            span.set_tag("wait.timeout_seconds", timeout)
+            condition = WAIT_CONDITIONS[kind](step)
+            WebDriverWait(driver, timeout, poll_frequency=WAIT_POLL_SECONDS).until(condition)
+
+class PayloadError(ValueError):
+    """Mensagem malformada: vai direto para a DLQ sem abrir o navegador."""
+
+class JobMessage:
+    """Payload de uma mensagem SQS já decodificado e validado."""
+    def __init__(self, job_type, definition, url, waits, form, payload):
+        self.job_type = job_type
+        self.definition = definition
+        self.url = url
+        self.waits = waits
+        self.form = form
+        self.payload = payload
+
+def decode_json(body):
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+def _is_number(value, minimum=0, allow_minimum=False, maximum=math.inf):
+    # json.loads aceita Infinity/NaN: só números finitos passam
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        return False
+    if value > maximum:
+        return False
+    return value >= minimum if allow_minimum else value > minimum
+
+def _validate_waits(waits):
+    """Valida todos os parâmetros dos passos, para que nenhum erro de configuração só apareça no navegador."""
+    if not isinstance(waits, list):
+        raise PayloadError("'waits' deve ser uma lista.")
+    for step in waits:
+        if not isinstance(step, dict) or step.get("type") not in WAIT_CONDITIONS:
+            raise PayloadError(f"Passo de espera inválido: {step!r}")
+        if step["type"] in ("element_present", "element_visible"):
+            if not isinstance(step.get("selector"), str) or step.get("by", "css") not in LOCATOR_STRATEGIES:
+                raise PayloadError(f"Seletor inválido no passo de espera: {step!r}")
+        if step["type"] == "ready_state" and step.get("state", "complete") not in READY_STATES:
+            raise PayloadError(f"Estado inválido no passo 'ready_state': {step!r}")
+        if step["type"] == "network_idle":
+            idle_ms = step.get("idle_ms", 500)
+            if not isinstance(idle_ms, int) or isinstance(idle_ms, bool) or idle_ms <= 0:
+                raise PayloadError(f"'idle_ms' deve ser um inteiro positivo: {step!r}")
+        if step["type"] == "js" and not isinstance(step.get("script"), str):
+            raise PayloadError(f"Passo 'js' sem script: {step!r}")
+        if not _is_number(step.get("timeout", WAIT_DEFAULT_TIMEOUT_SECONDS), maximum=WAIT_MAX_TIMEOUT_SECONDS):
+            raise PayloadError(
+                f"Timeout inválido no passo de espera (máx. {WAIT_MAX_TIMEOUT_SECONDS}s): {step!r}"
+            )
+    return waits
+
+def parse_payload(body):
+    """
+    Decodifica e valida o corpo da mensagem (objeto JSON). Campos aceitos:
+    job_type, url (ou WEBSITE_URL, formato legado), waits e form (campos do
+    postback, enviados pelo executor http ou preenchidos no navegador).
+    """
+    if not body or not body.strip():
+        raise PayloadError("Mensagem vazia.")
     try:
-        with tracer.trace("selenium.load_page", resource=WEBSITE_URL) as span:
+        payload = decode_json(body)
+    except ValueError as e:
+        raise PayloadError(f"JSON inválido: {e}")
+    if not isinstance(payload, dict):
+        raise PayloadError("O payload deve ser um objeto JSON.")
+
+    job_type = payload.get("job_type", "default")
+    if job_type not in JOB_DEFINITIONS:
+        raise PayloadError(f"Tipo de job desconhecido: {job_type!r}")
+    definition = JOB_DEFINITIONS[job_type]
+
+    url = payload.get("url", payload.get("WEBSITE_URL", definition.get("url", WEBSITE_URL)))
+    parsed = urlparse(url) if isinstance(url, str) else None
+    if parsed is None or parsed.scheme not in ("http", "https") or not parsed.netloc:
+        raise PayloadError(f"URL inválida: {url!r}")
+
+    waits = payload.get("waits")
+    if waits is None:
+        waits = definition.get("waits", [])
+
+    form = payload.get("form", definition.get("form", {}))
+    if not isinstance(form, dict) or not all(isinstance(v, str) for v in form.values()):
+        raise PayloadError("'form' deve ser um objeto com valores texto.")
+
+    return JobMessage(job_type, definition, url, _validate_waits(waits), form, payload)
+
+# Extensões por categoria de recurso. Os curingas de Network.setBlockedURLs casam
+# com a URL inteira, então cada extensão também precisa do padrão com query string
+# (ex.: logo.png?v=3, comum nos recursos com cache busting do ASP.NET)
+RESOURCE_EXTENSIONS = {
+    "images": ["png", "jpg", "jpeg", "gif", "webp", "svg", "ico", "bmp"],
+    "fonts": ["woff", "woff2", "ttf", "otf", "eot"],
+    "media": ["mp4", "webm", "ogg", "mp3", "wav", "m4a"],
+    "stylesheets": ["css"],
+}
+RESOURCE_URL_PATTERNS = {
+    resource_type: [pattern for ext in extensions for pattern in (f"*.{ext}", f"*.{ext}?*")]
+    for resource_type, extensions in RESOURCE_EXTENSIONS.items()
+}
+
+# Falhar na inicialização se alguma configuração citar categoria ou estratégia desconhecida
+for _job_type, _definition in JOB_DEFINITIONS.items():
+    if _definition.get("page_load_strategy", PAGE_LOAD_STRATEGY) not in PAGE_LOAD_STRATEGIES:
+        raise ValueError(f"page_load_strategy inválida em {_job_type!r}")
+    if _definition.get("executor", "browser") not in ("browser", "http"):
+        raise ValueError(f"executor inválido em {_job_type!r}")
+    _unknown = set(_definition.get("block_resources", BLOCKED_RESOURCE_TYPES)) - set(RESOURCE_URL_PATTERNS)
+    if _unknown:
+        raise ValueError(f"Categorias de bloqueio desconhecidas em {_job_type!r}: {sorted(_unknown)}")
+    for _name, _default, _allow_zero in (
+        ("page_load_timeout", PAGE_LOAD_TIMEOUT_SECONDS, False),
+        ("script_timeout", SCRIPT_TIMEOUT_SECONDS, False),
+        ("implicit_wait", IMPLICIT_WAIT_SECONDS, True),
+        ("cache_ttl", RESULT_CACHE_TTL_SECONDS, True),
+    ):
+        if not _is_number(_definition.get(_name, _default), allow_minimum=_allow_zero):
+            raise ValueError(f"{_name} inválido em {_job_type!r}")
+    if not isinstance(_definition.get("blocked_urls", BLOCKED_URL_PATTERNS), list):
+        raise ValueError(f"blocked_urls deve ser uma lista em {_job_type!r}")
+    if not isinstance(_definition.get("http_expect", ""), str):
+        raise ValueError(f"http_expect deve ser texto em {_job_type!r}")
+    _form = _definition.get("form", {})
+    if not isinstance(_form, dict) or not all(isinstance(v, str) for v in _form.values()):
+        raise ValueError(f"form deve ser um objeto com valores texto em {_job_type!r}")
+    try:
+        _validate_waits(_definition.get("waits", []))
+    except PayloadError as e:
+        raise ValueError(f"{e} (em {_job_type!r})")
+
+def blocked_url_patterns(definition):
+    """Monta a lista de bloqueio do tipo de job; listas vazias na definição liberam tudo."""
+    patterns = []
+    for resource_type in definition.get("block_resources", BLOCKED_RESOURCE_TYPES):
+        patterns.extend(RESOURCE_URL_PATTERNS[resource_type])
+    patterns.extend(definition.get("blocked_urls", BLOCKED_URL_PATTERNS))
+    return patterns
+
+def apply_request_blocking(driver, patterns):
+    """Aplica (ou limpa) o bloqueio de requisições; drivers reaproveitados sempre recebem a lista do job atual."""
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+
+def apply_driver_timeouts(driver, definition):
+    """Aplica os timeouts do tipo de job ao driver alugado."""
+    driver.set_page_load_timeout(definition.get("page_load_timeout", PAGE_LOAD_TIMEOUT_SECONDS))
+    driver.set_script_timeout(definition.get("script_timeout", SCRIPT_TIMEOUT_SECONDS))
+    driver.implicitly_wait(definition.get("implicit_wait", IMPLICIT_WAIT_SECONDS))
+
+class BrowserRequired(Exception):
+    """A resposta HTTP não basta para o job; é preciso abrir o navegador."""
+
+# Campos ocultos do ASP.NET que precisam voltar no postback
+ASPNET_HIDDEN_FIELDS = ("__VIEWSTATE", "__VIEWSTATEGENERATOR", "__EVENTVALIDATION", "__EVENTTARGET", "__EVENTARGUMENT")
+_INPUT_TAG = re.compile(r"<input\b[^>]*>", re.IGNORECASE)
+_TAG_ATTRIBUTE = re.compile(r'(\w+)\s*=\s*"([^"]*)"')
+_TITLE_TAG = re.compile(r"<title[^>]*>(.*?)</title>", re.IGNORECASE | re.DOTALL)
+
+http_pool = urllib3.PoolManager(
+    maxsize=WORKER_CONCURRENCY,
+    headers={"User-Agent": HTTP_USER_AGENT},
+    retries=urllib3.Retry(total=2, backoff_factor=0.5, status_forcelist=(502, 503, 504)),
+    timeout=urllib3.Timeout(total=HTTP_TIMEOUT_SECONDS),
+)
+
+def aspnet_hidden_fields(html):
+    """Extrai __VIEWSTATE e os demais campos ocultos do formulário ASP.NET."""
+    fields = {}
+    for tag in _INPUT_TAG.findall(html):
+        attributes = {k.lower(): v for k, v in _TAG_ATTRIBUTE.findall(tag)}
+        if attributes.get("name") in ASPNET_HIDDEN_FIELDS:
+            fields[attributes["name"]] = attributes.get("value", "")
+    return fields
+
+def _cookie_header(response):
+    cookies = [header.split(";", 1)[0] for header in response.headers.getlist("Set-Cookie")]
+    return "; ".join(cookies)
+
+def run_http_job(job):
+    """
+    Executa o job só com HTTP (pool de conexões): GET da página e, se o job tiver
+    "form", postback com os campos ocultos do ASP.NET e a sessão recebida no GET.
+    """
+    with tracer.trace("http.load_page", resource=job.url) as span:
+        start_time = time.time()
+        response = http_pool.request("GET", job.url)
+        html = response.data.decode("utf-8", errors="replace")
+
+        if job.form:
+            fields = {**aspnet_hidden_fields(html), **job.form}
+            headers = {"Content-Type": "application/x-www-form-urlencoded"}
+            cookie = _cookie_header(response)
+            if cookie:
+                headers["Cookie"] = cookie
+            response = http_pool.request("POST", job.url, body=urlencode(fields), headers=headers)
+            html = response.data.decode("utf-8", errors="replace")
+
+        load_time = time.time() - start_time
+        span.set_tag("http.status_code", response.status)
+        log.info(f"Página obtida via HTTP {job.url}", extra={"load_time_seconds": load_time})
+
+    if response.status >= 400:
+        raise RuntimeError(f"HTTP {response.status} ao acessar {job.url}")
+    expected = job.definition.get("http_expect")
+    if expected and expected not in html:
+        raise BrowserRequired(f"Texto esperado ausente na resposta HTTP de {job.url}")
+
+    title = _TITLE_TAG.search(html)
+    return {
+        "executor": "http",
+        "url": job.url,
+        "status": response.status,
+        "title": title.group(1).strip() if title else None,
+    }
+
+# Mensagens do chromedriver quando o navegador (não a página) se perdeu
+_SESSION_LOST_MESSAGES = ("chrome not reachable", "disconnected", "session deleted", "target crashed", "tab crashed")
+
+def session_lost(pooled, error):
+    """
+    A falha derrubou a sessão do driver (Chrome ou chromedriver mortos)? Falhas de
+    conteúdo, como timeouts de carga ou de espera, não: a aba nova do reset_driver
+    recupera o driver, e se não recuperar ele é descartado na devolução.
+    """
+    if isinstance(error, InvalidSessionIdException) or not pooled.alive():
+        return True
+    if isinstance(error, TimeoutException) or not isinstance(error, WebDriverException):
+        return False
+    message = str(error).lower()
+    return any(text in message for text in _SESSION_LOST_MESSAGES)
+
+# Preenche os campos por name; um botão de submit incluído nos campos é clicado (o
+# ASP.NET identifica a ação pelo botão), senão o formulário é enviado direto
+_SUBMIT_FORM_SCRIPT = """
+const fields = arguments[0];
+let form = null, submitter = null;
+for (const [name, value] of Object.entries(fields)) {
+    const element = document.getElementsByName(name)[0];
+    if (!element) return name;
+    form = form || element.form;
+    if (element.type === "submit" || element.type === "image" || element.tagName === "BUTTON") {
+        submitter = element;
+    } else {
+        element.value = value;
+    }
+}
+setTimeout(() => submitter ? submitter.click() : form.submit(), 0);
+return null;
+"""
+
+def submit_form(driver, form):
+    """Preenche e envia o formulário do job (o mesmo postback do executor http) e espera a nova página."""
+    page = driver.find_element(By.TAG_NAME, "html")
+    missing = driver.execute_script(_SUBMIT_FORM_SCRIPT, form)
+    if missing:
+        raise RuntimeError(f"Campo do formulário ausente na página: {missing!r}")
+    WebDriverWait(driver, WAIT_DEFAULT_TIMEOUT_SECONDS, poll_frequency=WAIT_POLL_SECONDS).until(
+        EC.staleness_of(page)
+    )
+
+def run_browser_job(job):
+    """
+    Executa o job num driver alugado do pool, com bloqueio de requisições, envio do
+    "form" (se houver) e waits do job, que valem para a página final.
+    """
+    concurrency_controller.acquire()
+    try:
+        pooled = driver_pool.acquire(job.definition.get("page_load_strategy", PAGE_LOAD_STRATEGY))
+    except Exception:
+        concurrency_controller.release()
+        raise
+    driver = pooled.driver
+    driver_pool.prefetch(pooled)
+    resource_sampler.begin_job(pooled)
+
+    try:
+        with tracer.trace("selenium.load_page", resource=job.url) as span:
+            blocked = blocked_url_patterns(job.definition)
+            apply_request_blocking(driver, blocked)
+            span.set_metric("network.blocked_patterns", len(blocked))
+            apply_driver_timeouts(driver, job.definition)
+            span.set_tag("page_load.strategy", pooled.page_load_strategy)
             start_time = time.time()
-            driver.get(WEBSITE_URL)
+            try:
+                driver.get(job.url)
+            except TimeoutException:
+                span.set_tag("page_load.timed_out", True)
+                raise
             load_time = time.time() - start_time
-            log.info(f"Navegando no site {WEBSITE_URL}", extra={"load_time_seconds": load_time})
+            log.info(f"Navegando no site {job.url}", extra={"load_time_seconds": load_time})
+
+        if job.form:
+            with tracer.trace("selenium.submit_form") as span:
+                span.set_metric("form.fields", len(job.form))
+                submit_form(driver, job.form)
 
         with tracer.trace("selenium.simulate_navigation") as span:
             start_time = time.time()
-            time.sleep(20)  
+            run_wait_steps(driver, job.waits)
             nav_time = time.time() - start_time
             log.info("Simulação de navegação concluída.", extra={"navigation_time_seconds": nav_time})
 
-        log.info("Mensagem processada com sucesso.", extra={"request_id": request_id})
+        return {"executor": "browser", "url": driver.current_url, "title": driver.title}
+
+    except Exception as e:
+        if session_lost(pooled, e):
+            pooled.healthy = False
+        raise
+
+    finally:
+        # Métricas de recursos do Chrome vão para o span do process_message
+        resource_sampler.end_job(pooled, tracer.current_span())
+        driver_pool.release(pooled)
+        concurrency_controller.release()
+
+EXECUTORS = {
+    "http": run_http_job,
+    "browser": run_browser_job,
+}
+
+def execute_job(job):
+    """Roda o executor do tipo de job; o http cai para o navegador quando necessário."""
+    executor = job.definition.get("executor", "browser")
+    if executor != "browser":
+        try:
+            return EXECUTORS[executor](job)
+        except BrowserRequired as e:
+            log.info(f"Recorrendo ao navegador: {e}")
+    return run_browser_job(job)
+
+class ExpiringStore:
+    """
+    Armazenamento chave/valor com expiração: LRU em memória limitado a max_entries
+    e, opcionalmente, uma tabela SQLite que sobrevive a reinícios e é
+    compartilhada entre processos. Usado pelo cache de resultados e pela deduplicação.
+    A tabela é podada a cada STORE_PRUNE_INTERVAL_SECONDS: saem as entradas expiradas
+    e as que passarem de max_entries, a partir das que expiram primeiro.
+    """
+    def __init__(self, max_entries, path=None, table="results"):
+        self.max_entries = max(1, max_entries)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._path = path
+        self._table = table
+        self._pruned_at = 0.0
+
+    def _connection(self):
+        # Conexão aberta sob demanda: cada processo do supervisor abre a sua após o fork
+        if self._db is None and self._path:
+            self._db = sqlite3.connect(self._path, check_same_thread=False, timeout=5)
+            with self._db:
+                self._db.execute(
+                    f"CREATE TABLE IF NOT EXISTS {self._table} (key TEXT PRIMARY KEY, result TEXT, expires_at REAL)"
+                )
+                self._db.execute(
+                    f"CREATE INDEX IF NOT EXISTS {self._table}_expires_at ON {self._table} (expires_at)"
+                )
+        return self._db
 
-        # Remover mensagem da fila após processamento bem-sucedido
-        sqs_client.delete_message(QueueUrl=SQS_QUEUE_URL, ReceiptHandle=receipt_handle)
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                result, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    return result
+                del self._entries[key]
+
+            db = self._connection()
+            if db is None:
+                return None
+            row = db.execute(
+                f"SELECT result, expires_at FROM {self._table} WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                return None
+            result = json.loads(row[0])
+            self._remember(key, result, row[1])
+            return result
+
+    def put(self, key, result, ttl_seconds):
+        if ttl_seconds <= 0:
+            return
+        expires_at = time.time() + ttl_seconds
+        with self._lock:
+            self._remember(key, result, expires_at)
+            db = self._connection()
+            if db is not None:
+                with db:
+                    db.execute(
+                        f"INSERT OR REPLACE INTO {self._table} (key, result, expires_at) VALUES (?, ?, ?)",
+                        (key, json.dumps(result), expires_at)
+                    )
+                if time.monotonic() - self._pruned_at >= STORE_PRUNE_INTERVAL_SECONDS:
+                    self._prune(db)
+
+    def _prune(self, db):
+        # Ambos os DELETEs usam o índice de expires_at
+        self._pruned_at = time.monotonic()
+        with db:
+            db.execute(f"DELETE FROM {self._table} WHERE expires_at <= ?", (time.time(),))
+            db.execute(
+                f"DELETE FROM {self._table} WHERE key IN ("
+                f"SELECT key FROM {self._table} ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def _remember(self, key, result, expires_at):
+        self._entries[key] = (result, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+def job_cache_key(job):
+    """Hash do payload normalizado: só os campos que mudam o resultado, em ordem estável."""
+    normalized = {
+        "job_type": job.job_type,
+        "url": job.url,
+        "waits": job.waits,
+        "form": job.form,
+    }
+    encoded = json.dumps(normalized, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+def message_dedup_keys(message):
+    """
+    Chaves de deduplicação: o MessageId e, se habilitado, o hash do corpo. A chave do
+    corpo vale no máximo pelo cache_ttl do tipo de job (ver process_message).
+    """
+    keys = []
+    if message.get('MessageId'):
+        keys.append("id:" + message['MessageId'])
+    if DEDUP_BY_CONTENT:
+        keys.append("body:" + hashlib.sha256(message.get('Body', '').encode("utf-8")).hexdigest())
+    return keys
+
+result_cache = ExpiringStore(RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_PATH, table="results")
+dedup_store = ExpiringStore(DEDUP_MAX_ENTRIES, DEDUP_STORE_PATH, table="processed_messages")
+
+# Setado quando o prazo de encerramento estoura: as mensagens em andamento já voltaram
+# à fila e os navegadores foram derrubados, então esses jobs não confirmam nem vão para a DLQ
+forced_shutdown = threading.Event()
+
+@tracer.wrap("process_message")
+def process_message(message):
+    body = message.get('Body', '')
+    receipt_handle = message['ReceiptHandle']
+
+    # Entrega repetida (at-least-once) de trabalho já concluído: só confirmar
+    dedup_keys = message_dedup_keys(message) if DEDUP_WINDOW_SECONDS > 0 else []
+    if any(dedup_store.get(key) for key in dedup_keys):
+        log.info("Mensagem duplicada, já processada. Confirmando sem reprocessar.")
+        ack_buffer.add(receipt_handle)
+        return
+
+    # Validar antes de alugar o navegador: mensagem ruim não custa um Chrome
+    try:
+        job = parse_payload(body)
+    except PayloadError as e:
+        log.warning(f"Mensagem inválida, enviando para a DLQ: {e}")
+        dlq_forwarder.add(message, e)
+        return
+
+    request_id = str(uuid.uuid4())
+    started_at = time.monotonic()
+    cache_key = job_cache_key(job)
+    cache_ttl = job.definition.get("cache_ttl", RESULT_CACHE_TTL_SECONDS)
+
+    try:
+        result = result_cache.get(cache_key) if cache_ttl > 0 else None
+        if result is not None:
+            log.info("Mensagem respondida pelo cache.", extra={"request_id": request_id, **result})
+        else:
+            result = execute_job(job)
+            result_cache.put(cache_key, result, cache_ttl)
+            log.info("Mensagem processada com sucesso.", extra={"request_id": request_id, **result})
+
+        for key in dedup_keys:
+            # Corpo repetido só é pulado enquanto o tipo de job aceitaria o resultado em cache
+            window = DEDUP_WINDOW_SECONDS if key.startswith("id:") else min(DEDUP_WINDOW_SECONDS, cache_ttl)
+            if window > 0:
+                dedup_store.put(key, True, window)
+
+        # Remover mensagem da fila após processamento bem-sucedido (em lote)
+        if not forced_shutdown.is_set():
+            ack_buffer.add(receipt_handle)
 
     except Exception as e:
-        log.error(f"Falha ao processar mensagem: {e}")
+        if forced_shutdown.is_set():
+            log.warning("Job interrompido pelo encerramento forçado; a mensagem já voltou para a fila.")
+            return
+        attempts = receive_count(message)
+        log.error(f"Falha ao processar mensagem: {e}", extra={"attempt": attempts})
 
-        if DLQ_URL:
-            sqs_client.send_message(QueueUrl=DLQ_URL, MessageBody=body)
+        # Antes do limite a mensagem volta a ficar visível e é retentada pelo SQS
+        if attempts >= MAX_PROCESSING_ATTEMPTS:
+            dlq_forwarder.add(message, e, time.monotonic() - started_at)
 
-    finally:
-        driver.quit()
+class AsyncChannel:
+    """
+    Fila asyncio limitada que liga os estágios do pipeline. Aceita itens de
+    corrotinas (put) e das threads do executor (put_threadsafe, que bloqueia a
+    thread enquanto a fila estiver cheia).
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._loop = None
+        self._queue = None
 
-def poll_sqs():
+    def bind(self, loop):
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+
+    async def put(self, item):
+        await self._queue.put(item)
+
+    def put_threadsafe(self, item):
+        coro = self._queue.put(item)
+        try:
+            future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        except RuntimeError:
+            # Loop já fechado após um encerramento forçado: a mensagem já voltou para a fila
+            coro.close()
+            return
+        future.result()
+
+    async def get(self):
+        return await self._queue.get()
+
+    async def get_batch(self, max_items, timeout, wait_first=True):
+        """Junta até max_items itens, esperando no máximo timeout segundos após o primeiro."""
+        items = []
+        if wait_first:
+            items.append(await self._queue.get())
+        deadline = self._loop.time() + timeout
+        while len(items) < max_items and items[-1:] != [None]:
+            remaining = deadline - self._loop.time()
+            if remaining <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return items
+
+class VisibilityHeartbeat:
     """
-    Loop que consulta a fila SQS e processa mensagens uma por vez.
-    Agora não há mais um trace para polling, apenas quando há mensagens.
+    Estende periodicamente o visibility timeout das mensagens em processamento,
+    para que jobs longos não voltem a ficar visíveis e sejam processados em dobro.
     """
-    while True:
+    def __init__(self, visibility_timeout, interval):
+        self.visibility_timeout = visibility_timeout
+        self.interval = interval
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def register(self, receipt_handle):
+        with self._lock:
+            self._in_flight[receipt_handle] = time.monotonic()
+
+    def unregister(self, receipt_handle):
+        with self._lock:
+            self._in_flight.pop(receipt_handle, None)
+
+    def in_flight(self):
+        with self._lock:
+            return list(self._in_flight)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await loop.run_in_executor(None, self.beat)
+            except Exception as e:
+                log.error("Erro no heartbeat de visibilidade.", extra={"exception": str(e)})
+
+    def beat(self):
+        """Renova, em lotes de até 10, as mensagens cuja última extensão já passou do intervalo."""
+        now = time.monotonic()
+        with self._lock:
+            due = [handle for handle, extended_at in self._in_flight.items() if now - extended_at >= self.interval]
+
+        for start in range(0, len(due), SQS_BATCH_SIZE):
+            chunk = due[start:start + SQS_BATCH_SIZE]
+            response = sqs_client.change_message_visibility_batch(
+                QueueUrl=SQS_QUEUE_URL,
+                Entries=[
+                    {"Id": str(i), "ReceiptHandle": handle, "VisibilityTimeout": self.visibility_timeout}
+                    for i, handle in enumerate(chunk)
+                ]
+            )
+            with self._lock:
+                for entry in response.get("Successful", []):
+                    handle = chunk[int(entry["Id"])]
+                    if handle in self._in_flight:
+                        self._in_flight[handle] = now
+            for entry in response.get("Failed", []):
+                log.warning(
+                    "Falha ao estender visibilidade da mensagem.",
+                    extra={"code": entry.get("Code"), "error": entry.get("Message")}
+                )
+                # Receipt handle inválido não vai se recuperar; parar de tentar
+                if entry.get("Code") == "ReceiptHandleIsInvalid":
+                    self.unregister(chunk[int(entry["Id"])])
+
+class AckBuffer:
+    """
+    Acumula os receipt handles de jobs concluídos e os remove da fila com
+    delete_message_batch, ao juntar 10 mensagens ou a cada flush_interval segundos.
+    O delete roda no estágio de ack, fora do caminho do worker.
+    """
+    def __init__(self, flush_interval, max_attempts, maxsize):
+        self.flush_interval = flush_interval
+        self.max_attempts = max(1, max_attempts)
+        self.channel = AsyncChannel(maxsize)
+
+    def add(self, receipt_handle):
+        """Chamado pelas threads do executor."""
+        self.channel.put_threadsafe((receipt_handle, 0))
+
+    async def put(self, receipt_handle):
+        await self.channel.put((receipt_handle, 0))
+
+    async def close(self):
+        await self.channel.put(None)
+
+    async def run(self):
+        """Consome o canal até receber None, confirmando tudo o que estiver pendente."""
+        loop = asyncio.get_running_loop()
+        retry = []
+        closed = False
+        while not closed:
+            batch = await self.channel.get_batch(SQS_BATCH_SIZE, self.flush_interval, wait_first=not retry)
+            if batch and batch[-1] is None:
+                closed = True
+                batch.pop()
+            pending, retry = retry + batch, []
+            if not pending:
+                continue
+            try:
+                retry = await loop.run_in_executor(None, self.flush, pending, closed)
+            except Exception as e:
+                log.error("Erro ao confirmar mensagens no SQS.", extra={"exception": str(e)})
+                retry = pending
+
+    def flush(self, pending, final=False):
+        """Remove as mensagens da fila e devolve as entradas que ainda devem ser retentadas."""
+        retry = []
+        for start in range(0, len(pending), SQS_BATCH_SIZE):
+            chunk = pending[start:start + SQS_BATCH_SIZE]
+            try:
+                response = sqs_client.delete_message_batch(
+                    QueueUrl=SQS_QUEUE_URL,
+                    Entries=[{"Id": str(i), "ReceiptHandle": handle} for i, (handle, _) in enumerate(chunk)]
+                )
+            except Exception as e:
+                log.error("Falha no delete_message_batch.", extra={"exception": str(e)})
+                retry.extend(chunk)
+                continue
+
+            for entry in response.get("Failed", []):
+                handle, attempts = chunk[int(entry["Id"])]
+                log.warning(
+                    "Falha ao remover mensagem da fila.",
+                    extra={"code": entry.get("Code"), "error": entry.get("Message")}
+                )
+                # Erros do remetente (ex.: receipt handle inválido) não melhoram com retry
+                if not entry.get("SenderFault"):
+                    retry.append((handle, attempts))
+
+        retry = [(handle, attempts + 1) for handle, attempts in retry]
+        exhausted = [handle for handle, attempts in retry if attempts >= self.max_attempts]
+        if exhausted:
+            # A mensagem voltará a ficar visível e poderá ser reprocessada
+            log.error("Desistindo de confirmar mensagens.", extra={"count": len(exhausted)})
+        retry = [(handle, attempts) for handle, attempts in retry if attempts < self.max_attempts]
+        if retry and final:
+            log.error("Mensagens não confirmadas no encerramento.", extra={"count": len(retry)})
+            return []
+        return retry
+
+def _string_attribute(value):
+    return {"DataType": "String", "StringValue": str(value)[:256]}
+
+def _number_attribute(value):
+    return {"DataType": "Number", "StringValue": str(value)}
+
+def receive_count(message):
+    return int(message.get('Attributes', {}).get('ApproximateReceiveCount', 1))
+
+class DlqForwarder:
+    """
+    Estágio que encaminha mensagens para a DLQ com send_message_batch (até 10 por
+    chamada), anexando classe do erro, número de tentativas e tempos como message
+    attributes. A original só é removida da fila depois que a DLQ confirmou a escrita.
+    """
+    def __init__(self, flush_interval, max_attempts, maxsize):
+        self.flush_interval = flush_interval
+        self.max_attempts = max(1, max_attempts)
+        self.channel = AsyncChannel(maxsize)
+
+    def add(self, message, error, processing_seconds=0.0):
+        """Chamado pelas threads do executor."""
+        attributes = {
+            "ErrorClass": _string_attribute(type(error).__name__),
+            "ErrorMessage": _string_attribute(str(error) or type(error).__name__),
+            "AttemptCount": _number_attribute(receive_count(message)),
+            "ProcessingSeconds": _number_attribute(round(processing_seconds, 3)),
+            "FailedAt": _number_attribute(int(time.time() * 1000)),
+        }
+        first_received = message.get('Attributes', {}).get('ApproximateFirstReceiveTimestamp')
+        if first_received:
+            attributes["FirstReceivedAt"] = _number_attribute(first_received)
+        self.channel.put_threadsafe((message.get('Body', ''), message['ReceiptHandle'], attributes, 0))
+
+    async def close(self):
+        await self.channel.put(None)
+
+    async def run(self):
+        """Consome o canal até receber None, encaminhando tudo o que estiver pendente."""
+        loop = asyncio.get_running_loop()
+        retry = []
+        closed = False
+        while not closed:
+            batch = await self.channel.get_batch(SQS_BATCH_SIZE, self.flush_interval, wait_first=not retry)
+            if batch and batch[-1] is None:
+                closed = True
+                batch.pop()
+            pending, retry = retry + batch, []
+            if not pending:
+                continue
+            if not DLQ_URL:
+                log.error(
+                    "DLQ_URL não está definida. Mensagens não podem ser enviadas para a DLQ.",
+                    extra={"count": len(pending)}
+                )
+                continue
+            try:
+                confirmed, retry = await loop.run_in_executor(None, self.flush, pending, closed)
+            except Exception as e:
+                log.error("Erro ao encaminhar mensagens para a DLQ.", extra={"exception": str(e)})
+                confirmed, retry = [], pending
+            for receipt_handle in confirmed:
+                await ack_buffer.put(receipt_handle)
+
+    def flush(self, pending, final=False):
+        """Envia as entradas à DLQ; devolve os receipt handles confirmados e as entradas a retentar."""
+        confirmed, retry = [], []
+        for chunk in _size_limited_chunks(pending):
+            try:
+                response = sqs_client.send_message_batch(
+                    QueueUrl=DLQ_URL,
+                    Entries=[
+                        {"Id": str(i), "MessageBody": body, "MessageAttributes": attributes}
+                        for i, (body, _, attributes, _) in enumerate(chunk)
+                    ]
+                )
+            except Exception as e:
+                log.error("Falha no send_message_batch para a DLQ.", extra={"exception": str(e)})
+                retry.extend(chunk)
+                continue
+
+            for entry in response.get("Successful", []):
+                confirmed.append(chunk[int(entry["Id"])][1])
+            for entry in response.get("Failed", []):
+                log.warning(
+                    "Falha ao enviar mensagem para a DLQ.",
+                    extra={"code": entry.get("Code"), "error": entry.get("Message")}
+                )
+                if not entry.get("SenderFault"):
+                    retry.append(chunk[int(entry["Id"])])
+
+        retry = [(body, handle, attributes, attempts + 1) for body, handle, attributes, attempts in retry]
+        exhausted = [entry for entry in retry if entry[3] >= self.max_attempts]
+        retry = [entry for entry in retry if entry[3] < self.max_attempts]
+        if exhausted or (retry and final):
+            # A original continua na fila e voltará a ser entregue
+            log.error("Mensagens não encaminhadas para a DLQ.", extra={"count": len(exhausted) + len(retry)})
+        return confirmed, ([] if final else retry)
+
+def _size_limited_chunks(entries):
+    """Divide as entradas em lotes de até 10 respeitando o limite de bytes do SQS."""
+    chunk, size = [], 0
+    for entry in entries:
+        entry_size = len(entry[0].encode("utf-8")) + len(json.dumps(entry[2]))
+        if chunk and (len(chunk) == SQS_BATCH_SIZE or size + entry_size > SQS_BATCH_MAX_BYTES):
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(entry)
+        size += entry_size
+    if chunk:
+        yield chunk
+
+visibility_heartbeat = VisibilityHeartbeat(VISIBILITY_TIMEOUT, HEARTBEAT_INTERVAL_SECONDS)
+ack_buffer = AckBuffer(ACK_FLUSH_INTERVAL_SECONDS, ACK_MAX_ATTEMPTS, STAGE_QUEUE_SIZE)
+dlq_forwarder = DlqForwarder(DLQ_FLUSH_INTERVAL_SECONDS, DLQ_MAX_ATTEMPTS, STAGE_QUEUE_SIZE)
+
+def poll_backoff(errors):
+    """Backoff exponencial com jitter, usado apenas após erros no receive."""
+    delay = min(POLL_BACKOFF_MAX_SECONDS, POLL_BACKOFF_BASE_SECONDS * (2 ** (errors - 1)))
+    return random.uniform(delay / 2, delay)
+
+def handle_message(message):
+    """Executado numa thread do executor de navegadores."""
+    # Sob o supervisor, respeita o limite global de navegadores entre processos
+    if browser_budget is not None:
+        browser_budget.acquire()
+    try:
+        with tracer.trace("sqs.receive_message", service="ecs-task-gui", span_type="queue"):
+            process_message(message)
+    finally:
+        if browser_budget is not None:
+            browser_budget.release()
+
+def return_to_queue(receipt_handles):
+    """Torna as mensagens visíveis de novo (visibility 0) para que outra task as processe já."""
+    for start in range(0, len(receipt_handles), SQS_BATCH_SIZE):
+        chunk = receipt_handles[start:start + SQS_BATCH_SIZE]
         try:
-            response = sqs_client.receive_message(
+            sqs_client.change_message_visibility_batch(
                 QueueUrl=SQS_QUEUE_URL,
-                MaxNumberOfMessages=MAX_NUMBER_OF_MESSAGES,
-                WaitTimeSeconds=10,
-                VisibilityTimeout=VISIBILITY_TIMEOUT
+                Entries=[
+                    {"Id": str(i), "ReceiptHandle": handle, "VisibilityTimeout": 0}
+                    for i, handle in enumerate(chunk)
+                ]
             )
-            messages = response.get("Messages", [])
+        except Exception as e:
+            log.error("Falha ao devolver mensagens à fila.", extra={"exception": str(e), "count": len(chunk)})
+    if receipt_handles:
+        log.info("Mensagens devolvidas à fila.", extra={"count": len(receipt_handles)})
+
+class AsyncConsumer:
+    """
+    Núcleo asyncio do consumidor: receive, dispatch, heartbeat, ack e DLQ são
+    tarefas independentes ligadas por filas limitadas. O trabalho bloqueante do
+    Selenium roda num executor com WORKER_CONCURRENCY threads, e cada mensagem
+    ocupa um slot até terminar, então só se recebe o que há capacidade para processar.
+
+    No SIGTERM/SIGINT o consumidor para de receber, devolve à fila (visibility 0)
+    o que ainda não começou, espera os jobs em andamento até SHUTDOWN_GRACE_SECONDS
+    e só então fecha os estágios de DLQ e ack.
+    """
+    def __init__(self, concurrency, prefetch, receive_concurrency, grace_seconds):
+        self.concurrency = max(1, concurrency)
+        self.prefetch = max(0, prefetch)
+        self.capacity = self.concurrency + self.prefetch
+        self.receive_concurrency = max(1, receive_concurrency)
+        self.grace_seconds = grace_seconds
+        self._reserved = 0
+        self._capacity_freed = None
+        self._dispatch = None
+        self._browser_executor = None
+        self._stopping = None
+        self._pending_receives = set()
+
+    def request_stop(self):
+        """Inicia o encerramento gracioso; chamado na thread do event loop."""
+        if self._stopping is not None and not self._stopping.is_set():
+            log.info("Sinal de parada recebido, drenando consumidor.")
+            self._stopping.set()
+
+    async def run(self, stop_requested=None):
+        loop = asyncio.get_running_loop()
+        # Executor padrão para as chamadas boto3 (receives em long polling + estágios)
+        loop.set_default_executor(
+            ThreadPoolExecutor(max_workers=self.receive_concurrency + 4, thread_name_prefix="sqs-io")
+        )
+        self._browser_executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="worker")
+        self._capacity_freed = asyncio.Event()
+        self._dispatch = asyncio.Queue(maxsize=self.capacity)
+        self._stopping = asyncio.Event()
+        ack_buffer.channel.bind(loop)
+        dlq_forwarder.channel.bind(loop)
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                loop.add_signal_handler(signum, self.request_stop)
+        # Sinal recebido antes do loop assumir os handlers (ver consume)
+        if stop_requested is not None and stop_requested.is_set():
+            self.request_stop()
+
+        ack_task = asyncio.create_task(ack_buffer.run())
+        dlq_task = asyncio.create_task(dlq_forwarder.run())
+        heartbeat_task = asyncio.create_task(visibility_heartbeat.run())
+        controller_task = asyncio.create_task(concurrency_controller.run()) if ADAPTIVE_CONCURRENCY else None
+        dispatchers = [asyncio.create_task(self._dispatch_loop()) for _ in range(self.concurrency)]
+        receivers = [asyncio.create_task(self._receive_loop()) for _ in range(self.receive_concurrency)]
+
+        try:
+            await self._stopping.wait()
+        finally:
+            deadline = loop.time() + self.grace_seconds
+            await self._stop_receiving(receivers, dispatchers, deadline)
+            await self._drain_workers(dispatchers, deadline)
+            heartbeat_task.cancel()
+            if controller_task:
+                controller_task.cancel()
+            await dlq_forwarder.close()
+            await dlq_task
+            await ack_buffer.close()
+            await ack_task
+            log.info("Consumidor encerrado.")
+
+    async def _stop_receiving(self, receivers, dispatchers, deadline):
+        """Cancela os receives e devolve à fila tudo o que foi recebido mas não começou."""
+        loop = asyncio.get_running_loop()
+        # Antes do primeiro await: esvaziar a fila de dispatch e encerrar os dispatchers,
+        # senão os livres continuam iniciando mensagens pré-buscadas durante a drenagem
+        unstarted = []
+        while not self._dispatch.empty():
+            message = self._dispatch.get_nowait()
+            visibility_heartbeat.unregister(message['ReceiptHandle'])
+            self._release(1)
+            unstarted.append(message['ReceiptHandle'])
+        for _ in dispatchers:
+            self._dispatch.put_nowait(None)
+        for task in receivers:
+            task.cancel()
+        await asyncio.gather(*receivers, return_exceptions=True)
+
+        # Receives já em voo terminam na thread do executor; o que chegar volta para a fila
+        if self._pending_receives:
+            done, _ = await asyncio.wait(self._pending_receives, timeout=max(0, deadline - loop.time()))
+            for future in done:
+                if not future.cancelled() and future.exception() is None:
+                    unstarted.extend(m['ReceiptHandle'] for m in future.result().get("Messages", []))
+
+        await loop.run_in_executor(None, return_to_queue, unstarted)
 
-            # Se não houver mensagens, evitar spans desnecessários
-            if not messages:
-                time.sleep(POLL_INTERVAL_SECONDS)
+    async def _drain_workers(self, dispatchers, deadline):
+        """Espera os jobs em andamento; estourado o prazo, devolve as mensagens e derruba os navegadores."""
+        loop = asyncio.get_running_loop()
+        _, running = await asyncio.wait(dispatchers, timeout=max(0, deadline - loop.time()))
+        if running:
+            forced_shutdown.set()
+            in_flight = visibility_heartbeat.in_flight()
+            log.error("Prazo de encerramento esgotado com jobs em andamento.", extra={"count": len(in_flight)})
+            await loop.run_in_executor(None, return_to_queue, in_flight)
+            concurrency_controller.close()
+            await loop.run_in_executor(None, functools.partial(driver_pool.shutdown, force=True))
+            await asyncio.wait(running, timeout=SHUTDOWN_FORCE_WAIT_SECONDS)
+        self._browser_executor.shutdown(wait=not running)
+
+    def _allowed(self):
+        """Slots que podem estar ocupados agora: com o limite adaptativo reduzido, não
+        receber mensagens que só ficariam paradas (e invisíveis) esperando navegador."""
+        if not ADAPTIVE_CONCURRENCY:
+            return self.capacity
+        return min(self.capacity, concurrency_controller.limit + self.prefetch)
+
+    async def _reserve(self, max_count):
+        """Espera ao menos um slot livre e reserva até max_count slots."""
+        while self._reserved >= self._allowed():
+            self._capacity_freed.clear()
+            # O limite adaptativo muda em outra thread: reavaliar a cada amostragem
+            waiter = asyncio.ensure_future(self._capacity_freed.wait())
+            try:
+                await asyncio.wait({waiter}, timeout=ADAPTIVE_SAMPLE_INTERVAL_SECONDS)
+            finally:
+                waiter.cancel()
+        count = min(max_count, self._allowed() - self._reserved)
+        self._reserved += count
+        return count
+
+    def _release(self, count):
+        self._reserved -= count
+        self._capacity_freed.set()
+
+    async def _receive_loop(self):
+        """
+        Recebe mensagens quando há capacidade livre. A espera com a fila vazia fica
+        por conta do long polling do SQS; só há sleep (com backoff) quando o receive falha.
+        """
+        loop = asyncio.get_running_loop()
+        errors = 0
+        while True:
+            count = await self._reserve(MAX_NUMBER_OF_MESSAGES)
+            future = loop.run_in_executor(None, functools.partial(
+                sqs_client.receive_message,
+                QueueUrl=SQS_QUEUE_URL,
+                MaxNumberOfMessages=count,
+                WaitTimeSeconds=RECEIVE_WAIT_TIME_SECONDS,
+                VisibilityTimeout=VISIBILITY_TIMEOUT,
+                AttributeNames=["ApproximateReceiveCount", "ApproximateFirstReceiveTimestamp"]
+            ))
+            self._pending_receives.add(future)
+            try:
+                # shield: cancelar o receive não pode perder as mensagens que ele trouxer
+                response = await asyncio.shield(future)
+                self._pending_receives.discard(future)
+                messages = response.get("Messages", [])
+            except asyncio.CancelledError:
+                self._release(count)
+                raise
+            except Exception as e:
+                self._pending_receives.discard(future)
+                self._release(count)
+                errors += 1
+                delay = poll_backoff(errors)
+                log.error(
+                    "Erro no loop principal de polling SQS.",
+                    extra={"exception": str(e), "retry_in_seconds": delay}
+                )
+                await asyncio.sleep(delay)
                 continue
 
-            # Criar um novo trace apenas para mensagens recebidas
+            errors = 0
+            self._release(count - len(messages))
             for message in messages:
-                with tracer.trace("sqs.receive_message", service="ecs-task-gui", span_type="queue"):
-                    process_message(message)
+                visibility_heartbeat.register(message['ReceiptHandle'])
+                self._dispatch.put_nowait(message)  # Slot já reservado: nunca enche
 
-        except Exception as e:
-            log.error("Erro no loop principal de polling SQS.", extra={"exception": str(e)})
+    async def _dispatch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await self._dispatch.get()
+            if message is None:
+                return
+            try:
+                await loop.run_in_executor(self._browser_executor, handle_message, message)
+            except Exception as e:
+                log.error("Erro no worker ao processar mensagem.", extra={"exception": str(e)})
+            finally:
+                visibility_heartbeat.unregister(message['ReceiptHandle'])
+                self._release(1)
 
-def main():
+consumer = AsyncConsumer(WORKER_CONCURRENCY, PREFETCH_MESSAGES, RECEIVE_CONCURRENCY, SHUTDOWN_GRACE_SECONDS)
+
+class BrowserBudget:
+    """
+    Limite global de jobs simultâneos compartilhado entre os processos do supervisor.
+    O uso é contabilizado por processo (slot) para que o supervisor devolva as
+    vagas de um filho que morreu no meio de um job.
+    """
+    def __init__(self, limit, slots):
+        self.limit = limit
+        self._usage = multiprocessing.Array('i', slots)
+        self._cond = multiprocessing.Condition(self._usage.get_lock())
+        self.slot = None
+
+    def acquire(self):
+        with self._cond:
+            while sum(self._usage) >= self.limit:
+                self._cond.wait()
+            self._usage[self.slot] += 1
+
+    def release(self):
+        with self._cond:
+            self._usage[self.slot] -= 1
+            self._cond.notify()
+
+    def reset(self, slot):
+        with self._cond:
+            self._usage[slot] = 0
+            self._cond.notify_all()
+
+browser_budget = None
+
+def consume():
     log.info("Iniciando script de polling do SQS com Datadog APM...")
-    poll_sqs()
+    stop_requested = threading.Event()
+
+    def request_stop(signum, frame):
+        stop_requested.set()
+
+    # Fora do event loop (aquecimento e encerramento) o sinal só marca a parada, para
+    # não deixar chromedrivers, Chromes e perfis temporários órfãos
+    def install_stop_handlers():
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, request_stop)
+
+    install_stop_handlers()
+    try:
+        driver_pool.warm(stop_requested)
+        if stop_requested.is_set():
+            log.info("Sinal de parada recebido durante o aquecimento, encerrando.")
+        else:
+            resource_sampler.start()
+            asyncio.run(consumer.run(stop_requested))
+    finally:
+        # O asyncio devolve os sinais ao padrão ao fechar o loop
+        install_stop_handlers()
+        resource_sampler.stop()
+        driver_pool.shutdown()
+        # Enviar traces e perfis pendentes antes de sair
+        tracer.shutdown()
+        profiler.stop()
+        log_writer.stop()
+
+def _child_main(budget, slot):
+    global browser_budget
+    # O filho herda o handler do supervisor no fork; voltar ao padrão até o consume instalar os seus
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    budget.slot = slot
+    browser_budget = budget
+    consume()
+
+def supervise():
+    """
+    Inicia CONSUMER_PROCESSES consumidores (fork), reinicia os que morrerem e,
+    no SIGTERM, repassa o sinal aos filhos e espera até SUPERVISOR_DRAIN_SECONDS
+    antes de matá-los.
+    """
+    ctx = multiprocessing.get_context("fork")
+    budget = BrowserBudget(GLOBAL_MAX_BROWSERS, CONSUMER_PROCESSES)
+    children = [None] * CONSUMER_PROCESSES
+    restart_at = [0.0] * CONSUMER_PROCESSES
+    stopping = threading.Event()
+
+    def request_stop(signum, frame):
+        stopping.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    log.info(
+        "Iniciando supervisor de consumidores.",
+        extra={"processes": CONSUMER_PROCESSES, "global_max_browsers": GLOBAL_MAX_BROWSERS}
+    )
+
+    while not stopping.is_set():
+        now = time.monotonic()
+        for slot, child in enumerate(children):
+            if child is not None and not child.is_alive():
+                log.error("Consumidor encerrado, reiniciando.", extra={"slot": slot, "exitcode": child.exitcode})
+                budget.reset(slot)
+                children[slot] = None
+                restart_at[slot] = now + SUPERVISOR_RESTART_DELAY_SECONDS
+            if children[slot] is None and now >= restart_at[slot]:
+                child = ctx.Process(target=_child_main, args=(budget, slot), name=f"consumer-{slot}")
+                child.start()
+                children[slot] = child
+        stopping.wait(1)
+
+    log.info("SIGTERM recebido, drenando consumidores.")
+    running = [child for child in children if child is not None and child.is_alive()]
+    for child in running:
+        child.terminate()
+    deadline = time.monotonic() + SUPERVISOR_DRAIN_SECONDS
+    for child in running:
+        child.join(max(0, deadline - time.monotonic()))
+        if child.is_alive():
+            log.error("Consumidor não terminou no prazo, forçando.", extra={"pid": child.pid})
+            child.kill()
+            child.join()
+
+def main():
+    if sys.argv[1:2] == ["supervise"]:
+        supervise()
+    elif sys.argv[1:2] == ["benchmark-profiles"]:
+        benchmark_launch_profiles(int(sys.argv[2]) if len(sys.argv) > 2 else 3)
+    else:
+        consume()
 
 if __name__ == '__main__':
     main()